@@ -18,7 +18,10 @@
 # along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import logging
 from optparse import OptionParser
+import threading
+import time
 
 import dbus
 import dbus.mainloop.glib
@@ -27,6 +30,7 @@ import dbus.service
 import glib
 import gobject
 
+from . import tracing
 from .consts import DAEMON_BUS_NAME
 
 APP_BUS_PREFIX = 'org.lyricsources.'
@@ -40,6 +44,22 @@ class AlreadyRunningException(Exception):
     """
     pass
 
+def _traced_call(target):
+    """ Wrap `target` to record its wait and run time on the main thread in
+    the trace of the calling thread.
+    """
+    trace = tracing.current_context()
+    queued = time.time()
+    def call(*args, **kwargs):
+        tracing.record('main thread wait', queued, id=trace)
+        with tracing.span('main thread call',
+                          {'target': getattr(target, '__name__', repr(target)),
+                           'trace': trace}):
+            with tracing.context(trace):
+                return target(*args, **kwargs)
+    return call
+
+
 class App(object):
     """ Basic class to create a component application for OSD Lyrics.
 
@@ -74,6 +94,12 @@ class App(object):
         self._loop = glib.MainLoop()
         self._conn = dbus.SessionBus(mainloop=DBusGMainLoop())
         self._bus_names = []
+        self._http_client = None
+        self._download_store = None
+        # Calls queued by run_on_main_thread, dispatched by one idle source
+        self._main_thread_lock = threading.Lock()
+        self._main_thread_calls = []
+        self._main_thread_source = None
         try:
             self.request_bus_name(APP_BUS_PREFIX + name,
                                   singleton)
@@ -118,6 +144,33 @@ class App(object):
     def loop(self):
         return self._loop
 
+    @property
+    def http_client(self):
+        """The lyricsources.asynchttp.AsyncHTTPClient running in the main loop
+
+        The client is created on first use.
+        """
+        if self._http_client is None:
+            from .asynchttp import AsyncHTTPClient
+            self._http_client = AsyncHTTPClient()
+        return self._http_client
+
+    def get_download_store(self, max_size):
+        """Return the lyricsources.store.DownloadStore shared by the plugins
+        running in the app
+
+        The store is created on first call. Its maximum size is the largest
+        `max_size` requested.
+        """
+        if self._download_store is None:
+            from .store import DownloadStore
+            from .utils import get_cache_path
+            self._download_store = DownloadStore(get_cache_path('downloads'),
+                                                 max_size)
+        elif max_size > self._download_store.max_size:
+            self._download_store.max_size = max_size
+        return self._download_store
+
     def run(self):
         """
         Runs the main loop
@@ -133,14 +186,35 @@ class App(object):
     def run_on_main_thread(self, target, args=(), kwargs={}):
         """Run a callable on main thread.
 
-        This is useful for notifying a thread is finished.
+        This is useful for notifying a thread is finished. It can be called
+        from any thread. Calls are run in the order they are queued. All the
+        calls queued before the main loop wakes up are run in that wakeup,
+        with a single glib source.
         """
-        def timeout_func():
-            target(*args, **kwargs)
+        if tracing.enabled:
+            target = _traced_call(target)
+        with self._main_thread_lock:
+            self._main_thread_calls.append((target, args, kwargs))
+            if self._main_thread_source is None:
+                self._main_thread_source = glib.idle_add(self._dispatch_main_thread_calls,
+                                                         priority=glib.PRIORITY_DEFAULT)
+
+    def _dispatch_main_thread_calls(self):
+        with self._main_thread_lock:
+            calls = self._main_thread_calls
+            self._main_thread_calls = []
+        for target, args, kwargs in calls:
+            try:
+                target(*args, **kwargs)
+            except Exception:
+                logging.exception('Got exception in main thread call')
+        with self._main_thread_lock:
+            if self._main_thread_calls:
+                # Calls queued while dispatching run in the next iteration, so
+                # that other sources of the main loop are not starved
+                return True
+            self._main_thread_source = None
             return False
-        source = glib.Timeout(0)
-        source.set_callback(timeout_func)
-        source.attach(self._loop.get_context())
 
     def quit(self):
         """Quits the main loop"""
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+
+import glib
+import pycurl
+
+from . import tracing
+from .coroutine import Future
+from .metrics import Histogram
+from .utils import curl_timings, make_curl
+
+__all__ = (
+    'AsyncHTTPClient',
+    )
+
+class AsyncHTTPClient(object):
+    """ Non-blocking HTTP client driven by the glib main loop.
+
+    All transfers share one pycurl.CurlMulti object. Its sockets and timers
+    are watched with glib sources, so thousands of requests can be in flight
+    in the main thread without any worker thread.
+
+    The client must be used in the thread running the main loop. Usually it is
+    obtained from `App.http_client` rather than created directly.
+    """
+
+    def __init__(self):
+        self._multi = pycurl.CurlMulti()
+        self._multi.setopt(pycurl.M_SOCKETFUNCTION, self._socket_cb)
+        self._multi.setopt(pycurl.M_TIMERFUNCTION, self._timer_cb)
+        # fd -> glib source ID
+        self._watches = {}
+        self._timer = None
+        # Curl -> (Future, StringIO)
+        self._requests = {}
+        # Curl -> (trace ID, start time) of transfers when tracing is enabled
+        self._traces = {}
+        self._latency = Histogram()
+
+    def fetch(self, url, port=0, method='GET', params={}, headers={}, timeout=15, proxy=None):
+        """ Start downloading `url`.
+
+        The arguments are the same as lyricsources.utils.http_download.
+
+        Returns: A lyricsources.coroutine.Future of a tuple of the HTTP status
+        code and the content. If the transfer fails, the Future fails with a
+        pycurl.error. Cancelling the Future aborts the transfer.
+        """
+        c, buf = make_curl(url, port=port, method=method, params=params,
+                           headers=headers, timeout=timeout, proxy=proxy)
+        future = Future()
+        self._requests[c] = (future, buf)
+        if tracing.enabled:
+            self._traces[c] = (tracing.current_context(), time.time())
+        future.add_done_callback(lambda f: self._on_future_done(c, f))
+        self._multi.add_handle(c)
+        return future
+
+    @property
+    def active_count(self):
+        """ The number of transfers in progress.
+        """
+        return len(self._requests)
+
+    @property
+    def latency(self):
+        """ A lyricsources.metrics.Histogram of the seconds transfers take.
+        """
+        return self._latency
+
+    def _on_future_done(self, c, future):
+        if future.cancelled() and c in self._requests:
+            del self._requests[c]
+            self._traces.pop(c, None)
+            self._multi.remove_handle(c)
+            c.close()
+
+    def _socket_cb(self, event, fd, multi, data):
+        source = self._watches.pop(fd, None)
+        if source is not None:
+            glib.source_remove(source)
+        if event == pycurl.POLL_REMOVE:
+            return
+        condition = glib.IO_ERR | glib.IO_HUP
+        if event in (pycurl.POLL_IN, pycurl.POLL_INOUT):
+            condition |= glib.IO_IN
+        if event in (pycurl.POLL_OUT, pycurl.POLL_INOUT):
+            condition |= glib.IO_OUT
+        self._watches[fd] = glib.io_add_watch(fd, condition, self._io_cb)
+
+    def _timer_cb(self, timeout_ms):
+        if self._timer is not None:
+            glib.source_remove(self._timer)
+            self._timer = None
+        if timeout_ms >= 0:
+            self._timer = glib.timeout_add(timeout_ms, self._timeout_cb)
+
+    def _io_cb(self, fd, condition):
+        action = 0
+        if condition & glib.IO_IN:
+            action |= pycurl.CSELECT_IN
+        if condition & glib.IO_OUT:
+            action |= pycurl.CSELECT_OUT
+        if condition & (glib.IO_ERR | glib.IO_HUP):
+            action |= pycurl.CSELECT_ERR
+        self._socket_action(fd, action)
+        return True
+
+    def _timeout_cb(self):
+        self._timer = None
+        self._socket_action(pycurl.SOCKET_TIMEOUT, 0)
+        return False
+
+    def _socket_action(self, fd, action):
+        while True:
+            ret, running = self._multi.socket_action(fd, action)
+            if ret != pycurl.E_CALL_MULTI_PERFORM:
+                break
+        self._read_info()
+
+    def _read_info(self):
+        while True:
+            queued, succeeded, failed = self._multi.info_read()
+            for c in succeeded:
+                future, buf = self._finish(c)
+                self._latency.observe(c.getinfo(pycurl.TOTAL_TIME))
+                future.set_result((c.getinfo(pycurl.HTTP_CODE), buf.getvalue()))
+                c.close()
+            for c, errno, errmsg in failed:
+                future, buf = self._finish(c)
+                self._latency.observe(c.getinfo(pycurl.TOTAL_TIME))
+                future.set_exception(pycurl.error(errno, errmsg))
+                c.close()
+            if queued == 0:
+                break
+
+    def _finish(self, c):
+        self._multi.remove_handle(c)
+        if c in self._traces:
+            trace, start = self._traces.pop(c)
+            tracing.record('http', start, curl_timings(c), id=trace)
+        return self._requests.pop(c)
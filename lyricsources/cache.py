@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import collections
+import time
+
+__all__ = (
+    'LRUCache',
+    )
+
+class LRUCache(object):
+    """ A bounded mapping that drops the least recently used entries, and
+    entries older than a time-to-live.
+
+    The cache is not thread-safe. It is expected to be used on the main thread.
+
+    >>> now = [0]
+    >>> cache = LRUCache(maxsize=2, ttl=10, timer=lambda: now[0])
+    >>> cache.set('a', 1)
+    >>> cache.set('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.set('c', 3)
+    >>> cache.get('b') is None
+    True
+    >>> len(cache)
+    2
+    >>> now[0] = 10
+    >>> cache.get('a', 'expired')
+    'expired'
+    >>> 'c' in cache
+    False
+    >>> cache.hits, cache.misses
+    (1, 2)
+    """
+
+    def __init__(self, maxsize, ttl=None, timer=time.time):
+        """
+
+        Arguments:
+        - `maxsize`: The maximum number of entries. If it is 0, nothing will be
+          cached.
+        - `ttl`: (optional) Seconds before an entry expires. If it is None,
+          entries never expire.
+        - `timer`: (optional) A callable returning the current time in seconds.
+        """
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._timer = timer
+        # key -> (expire time, value)
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= self._timer():
+            return None
+        self._entries[key] = entry
+        return entry
+
+    def get(self, key, default=None):
+        """ Return the value of `key`, or `default` if it is missing or expired.
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        """ Set the value of `key`, dropping the least recently used entries if
+        the cache is full.
+        """
+        if self._maxsize <= 0:
+            return
+        self._entries.pop(key, None)
+        expire = self._timer() + self._ttl if self._ttl is not None else None
+        self._entries[key] = (expire, value)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """ Remove `key` and return its value, or `default` if it is missing or
+        expired.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None or \
+                (entry[0] is not None and entry[0] <= self._timer()):
+            return default
+        return entry[1]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
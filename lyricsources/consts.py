@@ -33,6 +33,7 @@ MPRIS2_PLAYER_INTERFACE = 'org.mpris.MediaPlayer2.Player'
 MPRIS2_OBJECT_PATH = '/org/mpris/MediaPlayer2'
 LYRIC_SOURCE_PLUGIN_INTERFACE = 'org.lyricsources.LyricSourcePlugin'
 LYRIC_SOURCE_PLUGIN_OBJECT_PATH_PREFIX = '/org/lyricsources/LyricSourcePlugin/'
+METRICS_INTERFACE = 'org.lyricsources.Metrics'
 
 # Metadata keys
 METADATA_TITLE = 'title'
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import functools
+import sys
+import types
+
+from . import tracing
+
+__all__ = (
+    'CancelledError',
+    'Future',
+    'Return',
+    'coroutine',
+    'gather',
+    'run_coroutine',
+    )
+
+class CancelledError(Exception):
+    """ Raised when getting the result of a cancelled Future.
+    """
+    pass
+
+class Return(Exception):
+    """ Raise it in a coroutine to return a value, since generators cannot
+    return values in Python 2.
+    """
+
+    def __init__(self, value=None):
+        Exception.__init__(self, value)
+        self.value = value
+
+class Future(object):
+    """ The result of an operation that is not complete yet.
+
+    A Future is not thread-safe. Callbacks are run in the thread that sets the
+    result, which is the main thread for all users in lyricsources.
+
+    >>> log = []
+    >>> future = Future()
+    >>> future.add_done_callback(lambda f: log.append(f.result()))
+    >>> future.done()
+    False
+    >>> future.set_result(42)
+    >>> log
+    [42]
+    >>> future.cancel()
+    False
+    """
+
+    def __init__(self):
+        self._done = False
+        self._cancelled = False
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def cancelled(self):
+        return self._cancelled
+
+    def result(self):
+        """ Return the result, or raise the exception of the operation.
+        """
+        if self._cancelled:
+            raise CancelledError()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exc_info(self):
+        """ Return the exception info of a failed operation, or None.
+        """
+        return self._exc_info
+
+    def add_done_callback(self, fn):
+        """ Call `fn` with the future when it is done.
+        """
+        if self._done:
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
+    def _finish(self):
+        self._done = True
+        callbacks = self._callbacks
+        self._callbacks = []
+        for fn in callbacks:
+            fn(self)
+
+    def set_result(self, result):
+        if not self._done:
+            self._result = result
+            self._finish()
+
+    def set_exception(self, e):
+        self.set_exc_info((e.__class__, e, None))
+
+    def set_exc_info(self, exc_info):
+        if not self._done:
+            self._exc_info = exc_info
+            self._finish()
+
+    def cancel(self):
+        """ Cancel the operation. Return False if it is already done.
+        """
+        if self._done:
+            return False
+        self._cancelled = True
+        self._finish()
+        return True
+
+def gather(futures):
+    """ Return a Future of the list of results of `futures`.
+
+    It fails as soon as one of them fails. Cancelling it cancels all of them.
+
+    >>> a, b = Future(), Future()
+    >>> all = gather([a, b])
+    >>> b.set_result('b')
+    >>> all.done()
+    False
+    >>> a.set_result('a')
+    >>> all.result()
+    ['a', 'b']
+    """
+    futures = list(futures)
+    future = Future()
+    remaining = [len(futures)]
+
+    def on_done(f):
+        if future.done():
+            return
+        if f.cancelled():
+            future.cancel()
+        elif f.exc_info() is not None:
+            future.set_exc_info(f.exc_info())
+        else:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                future.set_result([f.result() for f in futures])
+
+    def on_cancel(f):
+        if f.cancelled():
+            for child in futures:
+                child.cancel()
+
+    if not futures:
+        future.set_result([])
+    for child in futures:
+        child.add_done_callback(on_done)
+    future.add_done_callback(on_cancel)
+    return future
+
+def run_coroutine(gen, on_yield=None):
+    """ Run a generator-based coroutine, and return a Future of its result.
+
+    The coroutine may yield:
+
+    - A Future: the coroutine is resumed with its result when it is done, or
+      the exception is raised in the coroutine if it fails.
+    - A list of Futures: the coroutine is resumed with the list of their
+      results when all of them are done.
+    - Anything else: the value is passed to `on_yield`, and the coroutine is
+      resumed immediately.
+
+    The coroutine returns a value by raising `Return(value)`. Cancelling the
+    returned Future closes the coroutine and cancels the Future it waits for.
+    The coroutine always runs in the trace of the caller (see
+    lyricsources.tracing), even when resumed by other callbacks.
+
+    >>> def add(x, y):
+    ...     x = yield x
+    ...     y = yield y
+    ...     yield 'progress'
+    ...     raise Return(x + y)
+    >>> a, b = Future(), Future()
+    >>> progress = []
+    >>> result = run_coroutine(add(a, b), on_yield=progress.append)
+    >>> a.set_result(1)
+    >>> result.done()
+    False
+    >>> b.set_result(2)
+    >>> result.result(), progress
+    (3, ['progress'])
+    """
+    future = Future()
+    waiting = [None]
+    trace = tracing.current_context()
+
+    def step(value=None, exc_info=None):
+        old_trace = tracing.swap_context(trace)
+        try:
+            run_steps(value, exc_info)
+        finally:
+            tracing.swap_context(old_trace)
+
+    def run_steps(value, exc_info):
+        while True:
+            try:
+                if exc_info is not None:
+                    yielded = gen.throw(*exc_info)
+                else:
+                    yielded = gen.send(value)
+            except Return as r:
+                future.set_result(r.value)
+                return
+            except StopIteration:
+                future.set_result(None)
+                return
+            except Exception:
+                future.set_exc_info(sys.exc_info())
+                return
+            value = exc_info = None
+            if isinstance(yielded, (list, tuple)) and yielded and \
+                    all(isinstance(f, Future) for f in yielded):
+                yielded = gather(yielded)
+            if not isinstance(yielded, Future):
+                if on_yield is not None:
+                    on_yield(yielded)
+                continue
+            if not yielded.done():
+                waiting[0] = yielded
+                yielded.add_done_callback(resume)
+                return
+            value, exc_info = outcome(yielded)
+
+    def outcome(f):
+        if f.cancelled():
+            return None, (CancelledError, CancelledError(), None)
+        if f.exc_info() is not None:
+            return None, f.exc_info()
+        return f.result(), None
+
+    def resume(f):
+        waiting[0] = None
+        if not future.done():
+            step(*outcome(f))
+
+    def on_cancel(f):
+        if f.cancelled():
+            gen.close()
+            if waiting[0] is not None:
+                waiting[0].cancel()
+
+    future.add_done_callback(on_cancel)
+    step()
+    return future
+
+def coroutine(func):
+    """ Decorator to make a generator function return a Future when called.
+
+    >>> @coroutine
+    ... def double(future):
+    ...     value = yield future
+    ...     raise Return(value * 2)
+    >>> f = Future()
+    >>> result = double(f)
+    >>> f.set_result(21)
+    >>> result.result()
+    42
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        ret = func(*args, **kwargs)
+        if isinstance(ret, types.GeneratorType):
+            return run_coroutine(ret)
+        future = Future()
+        future.set_result(ret)
+        return future
+    return wrapper
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -32,7 +32,8 @@ class Property(object):
 
     def __init__(self, dbus_interface, type_signature,
                  emit_change=True, readable=True, writeable=True,
-                 name=None, fget=None, fset=None, dbus_set=None):
+                 name=None, fget=None, fset=None, dbus_set=None,
+                 change_window=None):
         """
 
         Arguments:
@@ -47,6 +48,9 @@ class Property(object):
         - `writeable`: Whether the property is able to write with `Set` D-Bus method.
                        A property is writeable only when `writeable` is set to True
                        and a setter function is set.
+        - `change_window`: (float or None) Seconds to wait for more changes
+                           before emitting `PropertiesChanged`. If None, the
+                           `property_change_window` of the object is used.
         """
         self._type_signature = type_signature
         # CAVEAT: python-dbus uses "_dbus_interface" internally (in service.py)
@@ -60,6 +64,8 @@ class Property(object):
         self._emit_change = emit_change
         self._readable = readable
         self._writeable = writeable
+        self._change_window = change_window
+        self._convert = dbus_type_converter(type_signature)
 
     @property
     def interface(self):
@@ -79,6 +85,10 @@ class Property(object):
     def emit_change(self):
         return str(self._emit_change).lower()
 
+    @property
+    def change_window(self):
+        return self._change_window
+
     @property
     def type_signature(self):
         return self._type_signature
@@ -88,7 +98,7 @@ class Property(object):
             return self
         if self._fget is None:
             raise AttributeError("unreadable attribute")
-        return wrap_dbus_type(self._type_signature, self._fget(obj))
+        return self._convert(self._fget(obj))
 
     def __set__(self, obj, value):
         if self._fset is None:
@@ -202,25 +212,133 @@ DBUS_TYPE_MAP = {
     }
 
 
-def wrap_dbus_type(signature, value):
-    if signature in DBUS_TYPE_MAP:
-        dbustype = DBUS_TYPE_MAP[signature]
+def split_signature(signature):
+    """
+    Split a D-Bus signature into a list of complete types.
+
+    >>> split_signature('sa{sv}(ii)aai')
+    ['s', 'a{sv}', '(ii)', 'aai']
+    """
+    types = []
+    start = 0
+    depth = 0
+    for i, c in enumerate(signature):
+        if c in '({':
+            depth += 1
+        elif c in ')}':
+            depth -= 1
+        if depth == 0 and c != 'a':
+            types.append(signature[start:i + 1])
+            start = i + 1
+    if start != len(signature):
+        raise ValueError('Incomplete D-Bus signature %s' % signature)
+    return types
+
+
+def _basic_converter(dbustype):
+    def convert(value):
         if isinstance(value, dbustype):
             return value
-        else:
-            return dbustype(value)
-    elif signature.startswith('a{'):
-        if isinstance(value, dbus.Dictionary):
+        return dbustype(value)
+    return convert
+
+
+def _array_converter(element_signature):
+    convert_element = dbus_type_converter(element_signature)
+    def convert(value):
+        if isinstance(value, dbus.Array) and value.signature == element_signature:
             return value
-        else:
-            return dbus.Dictionary(value, signature=signature)
-    elif signature.startswith('a'):
-        if isinstance(value, dbus.Array):
+        return dbus.Array([convert_element(element) for element in value],
+                          signature=element_signature)
+    return convert
+
+
+def _byte_array_converter(value):
+    if isinstance(value, str):
+        return dbus.ByteArray(value)
+    if isinstance(value, dbus.Array) and value.signature == 'y':
+        return value
+    return dbus.Array([dbus.Byte(element) for element in value], signature='y')
+
+
+def _dict_converter(entry_signature):
+    key_signature, value_signature = split_signature(entry_signature)
+    convert_key = dbus_type_converter(key_signature)
+    convert_value = dbus_type_converter(value_signature)
+    def convert(value):
+        if isinstance(value, dbus.Dictionary) and value.signature == entry_signature:
             return value
-        else:
-            return dbus.Array(value, signature=signature)
-    elif signature.startswith('('):
+        return dbus.Dictionary([(convert_key(k), convert_value(v))
+                                for k, v in value.iteritems()],
+                               signature=entry_signature)
+    return convert
+
+
+def _struct_converter(fields_signature):
+    converters = [dbus_type_converter(field)
+                  for field in split_signature(fields_signature)]
+    def convert(value):
         if isinstance(value, dbus.Struct):
             return value
-        else:
-            return dbus.Struct(value, signature=signature)
+        return dbus.Struct([convert_field(field)
+                            for convert_field, field in zip(converters, value)],
+                           signature=fields_signature)
+    return convert
+
+
+def _variant_converter(value):
+    return value
+
+
+# signature -> converter
+_converters = {}
+
+
+def dbus_type_converter(signature):
+    """
+    Return a callable that converts a value to the D-Bus type of the complete
+    type `signature`, including the values inside arrays, dicts and structs.
+
+    Converters are built once for each signature, so that they are cheap to
+    call. Values that are already of the D-Bus type are returned as is.
+
+    >>> convert = dbus_type_converter('a{sa{su}}')
+    >>> value = convert({'search': {'succeeded': 1}})
+    >>> isinstance(value['search'], dbus.Dictionary)
+    True
+    >>> isinstance(value['search']['succeeded'], dbus.UInt32)
+    True
+    >>> dbus_type_converter('a{sa{su}}') is convert
+    True
+    """
+    convert = _converters.get(signature)
+    if convert is not None:
+        return convert
+    if signature in DBUS_TYPE_MAP:
+        convert = _basic_converter(DBUS_TYPE_MAP[signature])
+    elif signature == 'ay':
+        convert = _byte_array_converter
+    elif signature.startswith('a{'):
+        convert = _dict_converter(signature[2:-1])
+    elif signature.startswith('a'):
+        convert = _array_converter(signature[1:])
+    elif signature.startswith('('):
+        convert = _struct_converter(signature[1:-1])
+    else:
+        convert = _variant_converter
+    _converters[signature] = convert
+    return convert
+
+
+def wrap_dbus_type(signature, value):
+    """
+    Convert `value` to the D-Bus type of `signature`.
+
+    See `dbus_type_converter`.
+    """
+    return dbus_type_converter(signature)(value)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
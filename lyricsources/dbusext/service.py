@@ -19,8 +19,10 @@
 #/
 
 import logging
+import math
 import xml.etree.ElementTree as xet
 import sys
+import time
 
 import dbus
 import dbus.exceptions
@@ -35,6 +37,15 @@ from .property import Property
 # TODO: remove once we have fully migrated to Python 3
 INTROSPECT_ENCODING = 'unicode' if sys.version_info >= (3, 0) else 'us-ascii'
 
+INTROSPECT_DOCTYPE = '<!DOCTYPE node PUBLIC "-//freedesktop//DTD D-BUS Object Introspection 1.0//EN"\n "http://www.freedesktop.org/standards/dbus/1.0/introspect.dtd">\n'
+
+# The maximum number of introspection documents kept. The cache is cleared
+# when it is full, which only happens with a lot of fallback object paths.
+INTROSPECT_CACHE_SIZE = 256
+
+# (class, object path, child objects) -> introspection XML
+_introspect_cache = {}
+
 
 class ObjectTypeCls(dbus.service.Object.__class__):
     def __init__(cls, name, bases, dct):
@@ -54,13 +65,53 @@ class ObjectTypeCls(dbus.service.Object.__class__):
 
         cls._dbus_property_table = property_table
         property_table[cls.__module__ + '.' + cls.__name__] = property_dict
+
+        # The properties as class attributes resolve them, so that subclasses
+        # override properties of their bases
+        properties = {}
+        for klass in reversed(cls.__mro__):
+            for k, v in vars(klass).items():
+                if isinstance(v, Property):
+                    properties[k] = v
+                else:
+                    properties.pop(k, None)
+        # (interface, name) -> Property, with '' matching any interface
+        index = {}
+        # interface -> ((name, Property), ...) of readable properties, with
+        # '' for all interfaces
+        readable = {'': []}
+        for k, prop in properties.iteritems():
+            index[(prop.interface, k)] = prop
+            index[('', k)] = prop
+            if prop.readable:
+                readable.setdefault(prop.interface, []).append((k, prop))
+                readable[''].append((k, prop))
+        cls._dbus_property_index = index
+        cls._dbus_readable_properties = dict((iface, tuple(props))
+                                             for iface, props in readable.iteritems())
         super(ObjectTypeCls, cls).__init__(name, bases, dct)
 
 ObjectType = ObjectTypeCls('ObjectType', (dbus.service.Object, ), {})
 
 class Object(ObjectType):
     """ DBus object wrapper which provides DBus property support
+
+    Changes of properties are merged into one `PropertiesChanged` signal per
+    interface. Subclasses may override the following class attributes to emit
+    less often:
+
+    - `property_change_window`: Seconds to wait for more changes after a
+      property changes. By default changes are merged until the main loop is
+      idle. A property can have its own window, see `property`.
+    - `property_change_interval`: The minimum seconds between two emissions.
+
+    Waiting never goes beyond the window of the first pending change, so
+    properties changing all the time are still emitted.
     """
+
+    property_change_window = 0
+    property_change_interval = 0
+
     # __metaclass__ = ObjectType
     def __init__(self, conn=None, object_path=None, bus_name=None):
         """
@@ -91,12 +142,17 @@ class Object(ObjectType):
                                      bus_name=bus_name)
         self._changed_props = {}
         self._prop_change_timer = None
+        # The time the pending changes are emitted at
+        self._prop_change_deadline = 0
+        # The time of the last emission
+        self._prop_change_emitted = 0
 
     def _prop_changed_timeout_cb(self):
         self._prop_change_timer = None
+        self._prop_change_emitted = time.time()
         changed_props = {}
         for k, v in self._changed_props.items():
-            iface = getattr(self.__class__, k).interface
+            iface = self._dbus_property_index[('', k)].interface
             changed_props.setdefault(iface, {'changed': {}, 'invalidated': []})
             if v:
                 changed_props[iface]['changed'][k] = getattr(self, k)
@@ -117,9 +173,40 @@ class Object(ObjectType):
         - `changed`:
         """
         self._changed_props[prop_name] = emit_with_value
-        if not self._prop_change_timer:
+        prop = self._dbus_property_index.get(('', prop_name))
+        window = prop.change_window if prop is not None else None
+        if window is None:
+            window = self.property_change_window
+        now = time.time()
+        deadline = max(now + window,
+                       self._prop_change_emitted + self.property_change_interval)
+        if self._prop_change_timer:
+            if deadline >= self._prop_change_deadline:
+                return
+            glib.source_remove(self._prop_change_timer)
+        self._prop_change_deadline = deadline
+        if deadline > now:
+            self._prop_change_timer = glib.timeout_add(int(math.ceil((deadline - now) * 1000)),
+                                                       self._prop_changed_timeout_cb)
+        else:
             self._prop_change_timer = glib.idle_add(self._prop_changed_timeout_cb)
 
+    def flush_property_changes(self):
+        """ Emit pending property changes now.
+        """
+        if self._prop_change_timer:
+            glib.source_remove(self._prop_change_timer)
+            self._prop_changed_timeout_cb()
+
+    def remove_from_connection(self, connection=None, path=None):
+        """ Emit pending property changes, and make the object inaccessible
+        via the given D-Bus connection and object path.
+
+        See dbus.service.Object.remove_from_connection.
+        """
+        self.flush_property_changes()
+        dbus.service.Object.remove_from_connection(self, connection, path)
+
     @dbus.service.method(dbus_interface=dbus.PROPERTIES_IFACE,
                          in_signature='ss',
                          out_signature='v')
@@ -130,10 +217,9 @@ class Object(ObjectType):
         - `iface_name`:
         - `prop_name`:
         """
-        prop = getattr(self.__class__, prop_name, None)
-        if isinstance(prop, Property) and \
-                (len(iface_name) == 0 or prop.interface == iface_name):
-            return getattr(self, prop_name)
+        prop = self._dbus_property_index.get((iface_name, prop_name))
+        if prop is not None:
+            return prop.__get__(self)
         raise dbus.exceptions.DBusException('No property of %s.%s' % (iface_name, prop_name))
 
 
@@ -148,9 +234,8 @@ class Object(ObjectType):
         - `prop_name`:
         - `value`:
         """
-        prop = getattr(self.__class__, prop_name, None)
-        if isinstance(prop, Property) and \
-                (len(iface_name) == 0 or prop.interface == iface_name):
+        prop = self._dbus_property_index.get((iface_name, prop_name))
+        if prop is not None:
             prop.dbus_set(self, value)
         else:
             raise dbus.exceptions.DBusException('No property of %s.%s' % (iface_name, prop_name))
@@ -164,19 +249,8 @@ class Object(ObjectType):
         Arguments:
         - `iface_name`:
         """
-        ret = {}
-        property_dict = self._dbus_property_table[self.__class__.__module__ + '.' + self.__class__.__name__]
-
-        if iface_name != '' and iface_name in property_dict:
-            for prop_name, prop in property_dict[iface_name].iteritems():
-                if prop.readable:
-                    ret[prop_name] = prop.__get__(self)
-        elif iface_name == '':
-            for prop_list in property_dict.itervalues():
-                for prop_name, prop in prop_list.iteritems():
-                    if prop.readable:
-                        ret[prop_name] = prop.__get__(self)
-        return ret
+        return dict((prop_name, prop.__get__(self))
+                    for prop_name, prop in self._dbus_readable_properties.get(iface_name, ()))
 
     @dbus.service.signal(dbus_interface=dbus.PROPERTIES_IFACE,
                          signature='sa{sv}as')
@@ -189,7 +263,21 @@ class Object(ObjectType):
     def Introspect(self, object_path, connection):
         """
         Patch for dbus.service.Object to add property introspection data
+
+        The document only depends on the class, the object path and the child
+        objects exported under it, so it is built once for each of them.
         """
+        key = (self.__class__, object_path,
+               tuple(connection.list_exported_child_objects(object_path)))
+        xml = _introspect_cache.get(key)
+        if xml is None:
+            xml = self._introspect(object_path, connection)
+            if len(_introspect_cache) >= INTROSPECT_CACHE_SIZE:
+                _introspect_cache.clear()
+            _introspect_cache[key] = xml
+        return xml
+
+    def _introspect(self, object_path, connection):
         xml = dbus.service.Object.Introspect(self, object_path, connection)
         property_dict = self._dbus_property_table[self.__class__.__module__ + '.' + self.__class__.__name__]
         if property_dict == {}:
@@ -210,15 +298,15 @@ class Object(ObjectType):
             for prop in prop_list.itervalues():
                 iface.append(_property2element(prop))
             node.append(iface)
-        return '<!DOCTYPE node PUBLIC "-//freedesktop//DTD D-BUS Object Introspection 1.0//EN"\n "http://www.freedesktop.org/standards/dbus/1.0/introspect.dtd">\n' + \
-            xet.tostring(node, encoding=INTROSPECT_ENCODING)
+        return INTROSPECT_DOCTYPE + xet.tostring(node, encoding=INTROSPECT_ENCODING)
 
 
 def property(type_signature,
              dbus_interface,
              emit_change=True,
              readable=True,
-             writeable=True):
+             writeable=True,
+             change_window=None):
     """
     Decorator to define dbus properties as a class member.
 
@@ -256,6 +344,10 @@ def property(type_signature,
     - `writeable`: Whether the property is able to write with `Set` D-Bus method.
                    A property is writeable only when `writeable` is set to True and
                    a setter function is set.
+    - `change_window`: (float or None) Seconds to wait for more changes before
+                       emitting `PropertiesChanged`, for properties that change
+                       often. If None, the `property_change_window` of the
+                       object is used.
     """
     def dec_handler(fget):
         """
@@ -268,7 +360,8 @@ def property(type_signature,
                         name=fget.__name__,
                         readable=readable,
                         writeable=writeable,
-                        fget=fget)
+                        fget=fget,
+                        change_window=change_window)
     return dec_handler
 
 def _property2element(prop):
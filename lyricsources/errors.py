@@ -43,5 +43,11 @@ class BaseError(dbus.exceptions.DBusException):
         kwargs['name'] = dbus_error_name
         dbus.exceptions.DBusException.__init__(self, *args, **kwargs)
 
+class BusyError(BaseError):
+    """ Raised through D-Bus when a plugin has too many searches or downloads
+    to accept a new one. Clients may try again later.
+    """
+    pass
+
 class PatternException(Exception):
     pass
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import imp
+import logging
+import os.path
+from optparse import OptionParser
+
+import dbus
+
+from .app import App
+from .lyricsource import BaseLyricSourcePlugin
+
+HOST_APP_NAME = 'LyricSourceHost'
+
+
+def find_plugin_classes(module):
+    """ Return the lyric source plugin classes defined in `module`.
+    """
+    return [value for value in vars(module).values()
+            if isinstance(value, type) and
+            issubclass(value, BaseLyricSourcePlugin) and
+            value.__module__ == module.__name__]
+
+
+class PluginHost(object):
+    """ Runs several lyric source plugins in one process.
+
+    Each plugin is normally started by D-Bus activation as its own process,
+    with its own App, bus connection, main loop and HTTP client. The host loads
+    plugins into a single App instead. Each plugin keeps its object path and
+    bus name, and all of them share the connection, the HTTP client and the
+    download store. Search caches are kept by each plugin, since plugins never
+    return the results of each other. To run the host from the command line::
+
+      python -m lyricsources.host /path/to/netease.py /path/to/xiami.py
+    """
+
+    def __init__(self, watch_daemon=False):
+        """
+
+        Arguments:
+        - `watch_daemon`: Whether to exit when the daemon disappears.
+        """
+        self._app = App(HOST_APP_NAME, watch_daemon=watch_daemon)
+        self._plugins = []
+
+    def add(self, cls):
+        """ Create a plugin of class `cls` in the host.
+
+        Returns the plugin, or None if its bus name is owned by another
+        process, for example a plugin started on its own.
+        """
+        try:
+            plugin = cls(app=self._app)
+        except dbus.NameExistsException:
+            logging.warning('%s is already running, skipped', cls.__name__)
+            return None
+        self._plugins.append(plugin)
+        return plugin
+
+    def load(self, path):
+        """ Create the plugins defined in the Python file `path`.
+
+        Returns a list of the plugins created.
+        """
+        name = os.path.splitext(os.path.basename(path))[0]
+        module = imp.load_source('lyricsources_plugin_' + name, path)
+        plugins = []
+        for cls in find_plugin_classes(module):
+            plugin = self.add(cls)
+            if plugin is not None:
+                plugins.append(plugin)
+        return plugins
+
+    @property
+    def app(self):
+        return self._app
+
+    @property
+    def plugins(self):
+        """ The plugins running in the host.
+        """
+        return list(self._plugins)
+
+    def run(self):
+        """ Run the main loop of all plugins.
+        """
+        self._app.run()
+
+
+def main():
+    # The options of App are accepted so that they don't stop parsing. App
+    # parses them again to find the bus name of the daemon.
+    parser = OptionParser(usage='%prog [options] PLUGIN_FILE...')
+    parser.add_option('-w', '--watch-daemon', dest='watch_daemon',
+                      action='store', default='')
+    options, args = parser.parse_args()
+    if not args:
+        parser.error('No plugin file given')
+    host = PluginHost(watch_daemon=bool(options.watch_daemon))
+    for path in args:
+        try:
+            host.load(path)
+        except Exception:
+            logging.exception('Cannot load plugins from %s', path)
+    if not host.plugins:
+        logging.error('No plugin is running')
+        return 1
+    host.run()
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -24,15 +24,21 @@ __all__ = (
     'StringToken',
     'tokenize',
     'parse_lrc',
+    'fingerprint',
     )
 
+import hashlib
 import re
 
 import dbus.types
 
+from .ranking import normalize
+
 LINE_PATTERN = re.compile(r'(\[[^\[]*?\])')
 TIMESTAMP_PATTERN = re.compile(r'^\[(\d+(:\d+){0,2}(\.\d+)?)\]$')
 ATTR_PATTERN = re.compile(r'^\[([\w\d]+):(.*)\]$')
+# Timestamps are rounded to this many milliseconds in fingerprints
+FINGERPRINT_QUANTUM = 500
 
 class AttrToken(object):
     """
@@ -147,7 +153,55 @@ def parse_lrc(content):
         lyric['id'] = dbus.types.UInt32(i)
         i = i + 1
     return attrs, lyrics
-            
+
+
+def fingerprint(content):
+    """
+    Return a fingerprint of the timeline of an LRC file.
+
+    Attribute tags, blank lines, spaces, punctuation and case are ignored.
+    The `[offset:]` tag is applied to timestamps, which are then rounded to
+    `FINGERPRINT_QUANTUM` milliseconds, so the same lyric served by different
+    sources usually gets the same fingerprint.
+
+    Arguments:
+    - `content`: LRC file content encoded in UTF8
+
+    Returns: A string of hex digits, or None if there is no timed line
+
+    >>> a = fingerprint('[ti:Song][ar:Artist]\\n[00:01.00]Hello, world\\n[00:03.50]Bye')
+    >>> b = fingerprint('[00:01.02] hello world \\n\\n[00:03.48]bye!\\n[by:someone]')
+    >>> a == b
+    True
+    >>> a == fingerprint('[00:01.00]Hello, world\\n[00:05.00]Bye')
+    False
+    >>> a == fingerprint('[offset:1000]\\n[00:02.00]Hello, world\\n[00:04.50]Bye')
+    True
+    >>> a == fingerprint('[offset:-2000]\\n[00:01.00]Hello, world\\n[00:03.50]Bye')
+    False
+    >>> print fingerprint('Plain text lyric')
+    None
+    """
+    if isinstance(content, str):
+        content = content.decode('utf-8', 'replace')
+    attrs, lyrics = parse_lrc(content)
+    try:
+        offset = int(attrs.get('offset', 0))
+    except ValueError:
+        offset = 0
+    digest = hashlib.sha1()
+    empty = True
+    for lyric in lyrics:
+        text = normalize(lyric['text'])
+        if text:
+            # A positive offset shows lyrics earlier
+            timestamp = lyric['timestamp'] - offset
+            quantized = (timestamp + FINGERPRINT_QUANTUM / 2) // FINGERPRINT_QUANTUM
+            digest.update(('%d:%s\n' % (quantized, text)).encode('utf-8'))
+            empty = False
+    if empty:
+        return None
+    return digest.hexdigest()
 
 def test():
     TEST_CASE1 = \
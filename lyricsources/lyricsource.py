@@ -18,16 +18,29 @@
 # along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import inspect
 import logging
 import threading
+import time
 
 import dbus
+import glib
 
-from .app import App
+from . import tracing
+from .app import APP_BUS_PREFIX, App
+from .cache import LRUCache
 from .consts import (LYRIC_SOURCE_PLUGIN_INTERFACE,
-                     LYRIC_SOURCE_PLUGIN_OBJECT_PATH_PREFIX)
+                     LYRIC_SOURCE_PLUGIN_OBJECT_PATH_PREFIX, METRICS_INTERFACE)
+from .coroutine import run_coroutine
+from .lrc import fingerprint
 from .dbusext.service import Object as DBusObject, property as dbus_property
+from .errors import BusyError
 from .metadata import Metadata
+from .metrics import Counter, Histogram
+from .ranking import rank
+from .scheduler import (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, Task,
+                        TaskScheduler)
+from .utils import memory_file
 
 SEARCH_SUCCEED = 0
 SEARCH_CANCELLED = 1
@@ -37,27 +50,137 @@ DOWNLOAD_SUCCEED = 0
 DOWNLOAD_CANCELLED = 1
 DOWNLOAD_FAILED = 2
 
+# Values of the `priority` option of SearchWithOptions and DownloadWithOptions
+PRIORITY_NAMES = {'interactive': PRIORITY_INTERACTIVE,
+                  'background': PRIORITY_BACKGROUND}
+
+# Values of the `result-format` option of SearchWithOptions
+RESULT_FORMATS = ('dict', 'struct')
+
+# The fields of search results sent as structs with SearchCompleteStruct
+RESULT_STRUCT_FIELDS = ('sourceid', 'title', 'artist', 'album', 'comment',
+                        'length', 'downloadinfo')
+RESULT_STRUCT_SIGNATURE = 'sssssiv'
 
 
 def onmainthread(func):
     def decfunc(self, app, *args, **kwargs):
-        def timeout_cb():
-            func(self, *args, **kwargs)
-            return False
-        app.run_on_main_thread(timeout_cb)
+        app.run_on_main_thread(func, (self,) + args, kwargs)
     return decfunc
 
 
+def _to_bytes(content):
+    """ Convert lyric content to a dbus.ByteArray.
+
+    dbus.ByteArray is a str, so the content is sent as a whole on `ay`
+    arguments instead of being marshalled byte by byte. Unicode content is
+    encoded with UTF-8.
+
+    >>> _to_bytes(u'\\u6b4c')
+    dbus.ByteArray('\\xe6\\xad\\x8c')
+    >>> content = _to_bytes('lyric')
+    >>> _to_bytes(content) is content
+    True
+    """
+    if isinstance(content, dbus.ByteArray):
+        return content
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    return dbus.ByteArray(content)
+
+
+def _freeze(value):
+    """ Convert a D-Bus value to a hashable object.
+
+    Equal values give equal objects, regardless of D-Bus types or variant
+    levels, so that the result can be used as a key of dicts. Dicts and
+    sequences are tagged, so that a dict never equals a list of its items.
+
+    >>> _freeze({'id': 1}) == _freeze([('id', 1)])
+    False
+    >>> _freeze(dbus.Array([dbus.String(u'a')])) == _freeze(('a',))
+    True
+    """
+    if isinstance(value, dict):
+        return ('d', tuple(sorted((_freeze(k), _freeze(v)) for k, v in value.items())))
+    if isinstance(value, (list, tuple)):
+        return ('l', tuple(_freeze(v) for v in value))
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, unicode):
+        return unicode(value)
+    if isinstance(value, float):
+        return float(value)
+    if isinstance(value, (int, long)):
+        return int(value)
+    return value
+
+
+class _Flight(object):
+    """ A backend task shared by all tickets waiting for the same result.
+
+    A prefetch flight is started without any ticket, and its result is kept in
+    the prefetch buffer.
+    """
+
+    def __init__(self, key, prefetch=False, batch=False):
+        self.key = key
+        self.tickets = set()
+        self.prefetch = prefetch
+        # True if all tickets of the flight come from batch requests
+        self.batch = batch
+        self.task = None
+        # The time the task started running, or None while it is queued
+        self.started = None
+        # The trace ID of the ticket that started the flight
+        self.trace = None
+        # True if the flight is given up by the watchdog
+        self.reaped = False
+
+    def start(self):
+        """ Record that the task of the flight starts running.
+        """
+        self.started = time.time()
+
+
+class _EncodedResults(object):
+    """ Search results converted to D-Bus values in each format at most
+    once, however many tickets are waiting for them.
+    """
+
+    def __init__(self, results):
+        self._results = results
+        self._dicts = None
+        self._structs = None
+
+    @property
+    def dicts(self):
+        if self._dicts is None:
+            self._dicts = [result.to_dict() for result in self._results]
+        return self._dicts
+
+    @property
+    def structs(self):
+        if self._structs is None:
+            self._structs = [result.to_struct() for result in self._results]
+        return self._structs
+
+_NO_RESULTS = _EncodedResults([])
+
+
 class SearchResult(object):
     """ Lyrics that match the metadata to be searched.
     """
-    def __init__(self, sourceid, downloadinfo, title='', artist='', album='', comment=''):
+    def __init__(self, sourceid, downloadinfo, title='', artist='', album='', comment='',
+                 length=-1):
         """
 
         Arguments:
         - `title`: The matched lyric title.
         - `artist`: The matched lyric artist.
         - `album`: The matched lyric album.
+        - `length`: (optional) The duration of the matched track in
+          milliseconds, if the source knows it. It helps ranking results.
         - `downloadinfo`: Some additional data that is needed to download the
           lyric. Normally this value is the url or ID of the lyric.
           ``downloadinfo`` MUST be composed with basic types such as numbers,
@@ -70,16 +193,34 @@ class SearchResult(object):
         self._comment = comment
         self._sourceid = sourceid
         self._downloadinfo = downloadinfo
+        self._length = length
 
     def to_dict(self, ):
         """ Convert the result to a dict so that it can be sent with D-Bus.
         """
-        return { 'title': self._title,
-                 'artist': self._artist,
-                 'album': self._album,
-                 'comment': self._comment,
-                 'sourceid': self._sourceid,
-                 'downloadinfo': self._downloadinfo }
+        ret = { 'title': self._title,
+                'artist': self._artist,
+                'album': self._album,
+                'comment': self._comment,
+                'sourceid': self._sourceid,
+                'downloadinfo': self._downloadinfo }
+        if self._length > 0:
+            ret['length'] = dbus.Int32(self._length)
+        return ret
+
+    def to_struct(self):
+        """ Convert the result to a struct of `RESULT_STRUCT_FIELDS`, which is
+        sent with D-Bus with less overhead than `to_dict`. The length is -1 if it
+        is unknown.
+        """
+        return dbus.Struct((self._sourceid,
+                            self._title,
+                            self._artist,
+                            self._album,
+                            self._comment,
+                            dbus.Int32(self._length),
+                            self._downloadinfo),
+                           signature=RESULT_STRUCT_SIGNATURE)
 
 
 class BaseTaskThread(threading.Thread):
@@ -133,9 +274,60 @@ class BaseTaskThread(threading.Thread):
 
 class BaseLyricSourcePlugin(DBusObject):
     """ Base class for implementing a lyric source plugin
+
+    Plugins may override the following class attributes:
+
+    - `search_cache_size`: The maximum number of search results kept in memory.
+      Set it to 0 to disable the search cache.
+    - `search_cache_ttl`: Seconds before a cached search result expires.
+    - `download_store_size`: The maximum size in bytes of downloaded lyrics
+      kept on disk. The store is shared by all plugins. Set it to 0 to disable
+      the download store.
+    - `max_workers`: The maximum number of threads running searches and
+      downloads.
+    - `background_workers`: The maximum number of threads running background
+      tasks, such as batches and prefetches, at the same time. The other
+      threads are kept for interactive tasks.
+    - `prefetch_count`: The number of top search results to download in
+      background as soon as a search is complete, so that a later `Download`
+      of them completes immediately. Prefetch is disabled if it is 0.
+    - `prefetch_max_pending`: The maximum number of prefetches running at the
+      same time. Further prefetches are skipped rather than queued.
+    - `prefetch_buffer_size`: The maximum number of prefetched lyrics kept in
+      memory.
+    - `prefetch_buffer_ttl`: Seconds before a prefetched lyric is dropped.
+    - `max_in_flight`: The maximum number of searches and downloads, running
+      or queued, at the same time, not counting batch requests. Set it to 0
+      for no limit.
+    - `max_queued`: The maximum number of interactive tasks waiting for a
+      worker thread. Set it to 0 for no limit.
+    - `max_batch_pending`: The maximum number of batch tickets not completed
+      yet. A `SearchBatch` or `DownloadBatch` call that would exceed it is
+      rejected as a whole. Set it to 0 for no limit.
+    - `task_timeout`: Seconds before a search or download is given up, and
+      its tickets complete as failed. Set it to 0 to wait forever.
+
+    A request that would go beyond these limits is still answered from the
+    caches, but is not started. `Search` and `Download` raise BusyError for
+    it, and batch requests complete its ticket as failed. Prefetches are
+    skipped.
     """
 
-    def __init__(self, id, name=None, watch_daemon=False):
+    search_cache_size = 256
+    search_cache_ttl = 30 * 60
+    download_store_size = 32 * 1024 * 1024
+    max_workers = 8
+    background_workers = 2
+    prefetch_count = 0
+    prefetch_max_pending = 4
+    prefetch_buffer_size = 32
+    prefetch_buffer_ttl = 10 * 60
+    max_in_flight = 64
+    max_queued = 32
+    max_batch_pending = 1024
+    task_timeout = 60
+
+    def __init__(self, id, name=None, watch_daemon=False, app=None):
         """
         Create a new lyric source instance.
 
@@ -147,17 +339,66 @@ class BaseLyricSourcePlugin(DBusObject):
           localized. If `name` is missing, the plugin will take `id` as its
           name.
         - `watch_daemon`: Whether to watch daemon bus.
+        - `app`: (optional) An App shared with other plugins in the same
+          process, see lyricsources.host. The plugin requests its bus name on
+          it. If `app` is missing, the plugin creates its own App.
         """
         self._id = id
-        self._app = App('LyricSourcePlugin.' + id,
-                        watch_daemon=watch_daemon)
+        if app is None:
+            app = App('LyricSourcePlugin.' + id,
+                      watch_daemon=watch_daemon)
+        else:
+            app.request_bus_name(APP_BUS_PREFIX + 'LyricSourcePlugin.' + id,
+                                 do_not_queue=True)
+        self._app = app
         DBusObject.__init__(self,
                             conn=self._app.connection,
                             object_path=LYRIC_SOURCE_PLUGIN_OBJECT_PATH_PREFIX + self._id)
         self._search_count = 0
         self._download_count = 0
+        # ticket -> _Flight
         self._search_tasks = {}
         self._download_tasks = {}
+        # key -> _Flight, the tasks that are still running
+        self._search_flights = {}
+        self._download_flights = {}
+        self._search_cache = LRUCache(self.search_cache_size,
+                                      self.search_cache_ttl)
+        self._download_store = None
+        if self.download_store_size > 0:
+            self._download_store = self._app.get_download_store(self.download_store_size)
+        self._search_batch_tickets = set()
+        # Tickets of searches with the `result-format` option set to 'struct'
+        self._search_struct_tickets = set()
+        self._download_batch_tickets = set()
+        # ticket -> fd-threshold option of DownloadWithOptions
+        self._download_fd_thresholds = {}
+        self._search_batch_completions = []
+        self._download_batch_completions = []
+        self._batch_flush_pending = False
+        self._scheduler = TaskScheduler(self.max_workers,
+                                        self.background_workers)
+        # key -> [content, used]
+        self._prefetch_buffer = LRUCache(self.prefetch_buffer_size,
+                                         self.prefetch_buffer_ttl)
+        self._prefetch_pending = 0
+        self._prefetch_issued = 0
+        self._prefetch_hits = 0
+        # Indexed by SEARCH_* and DOWNLOAD_* status
+        self._search_outcomes = [Counter() for i in range(3)]
+        self._download_outcomes = [Counter() for i in range(3)]
+        self._search_latency = Histogram()
+        self._download_latency = Histogram()
+        self._download_store_hits = Counter()
+        self._download_store_misses = Counter()
+        # Downloads with the timeline of a different lyric in the store
+        self._download_store_equivalent = Counter()
+        self._search_rejected = Counter()
+        self._download_rejected = Counter()
+        self._search_reaped = Counter()
+        self._download_reaped = Counter()
+        # The glib source ID of the timer checking for stuck flights
+        self._watchdog = None
         self._name = name if name is not None else id
 
     def do_search(self, metadata):
@@ -171,45 +412,380 @@ class BaseLyricSourcePlugin(DBusObject):
         - `metadata`: The metadata of the track to search. The type of `metadata`
           is lyricsource.metadata.Metadata
 
-        Returns: A list of SearchResult objects
+        Returns: A list of SearchResult objects. They don't need to be sorted,
+        since they are ranked with `rank_results` before being sent.
+
+        If the results come in several requests, this method can be a generator
+        that yields lists of SearchResult objects as soon as they are ready.
+        Each list is sent to clients with the `SearchProgress` signal, and
+        `SearchComplete` is sent with all of them when the generator ends.
         """
         raise NotImplementedError()
 
+    def _run_search(self, flight, metadata):
+        """ Run `do_search` and report partial results of generators.
+
+        This method runs in the task thread.
+        """
+        results = self.do_search(metadata)
+        if not inspect.isgenerator(results):
+            return self.rank_results(metadata, list(results))
+        collected = []
+        for partial in results:
+            partial = list(partial)
+            if partial:
+                collected.extend(partial)
+                self.do_searchprogress(self._app, flight,
+                                       self.rank_results(metadata, partial))
+        return self.rank_results(metadata, collected)
+
+    def rank_results(self, metadata, results):
+        """ Return search results sorted by how well they match `metadata`,
+        best first.
+
+        Results sent with `SearchProgress` and `SearchComplete` are ranked
+        with this method. Plugins may override it to rank in their own way.
+        """
+        if len(results) < 2:
+            return results
+        order = rank(metadata, [(result._title, result._artist, result._album,
+                                 result._length)
+                                for result in results])
+        return [results[i] for i in order]
+
+    def _land_flight(self, flights, tasks, flight):
+        """ Remove a finished flight and return the tickets still waiting for it.
+        """
+        if flights.get(flight.key) is flight:
+            del flights[flight.key]
+        tickets = [ticket for ticket in sorted(flight.tickets)
+                   if tasks.get(ticket) is flight]
+        for ticket in tickets:
+            del tasks[ticket]
+        return tickets
+
+    def _cancel_ticket(self, flights, tasks, ticket):
+        """ Detach a ticket from its flight.
+
+        The flight is forgotten when no other ticket waits for it, so that its
+        result is dropped and a new request with the same key starts over. If
+        its task is still queued, it will not run at all.
+
+        Return False if the ticket does not exist.
+        """
+        flight = tasks.pop(ticket, None)
+        if flight is None:
+            return False
+        flight.tickets.discard(ticket)
+        if not flight.tickets and flights.get(flight.key) is flight:
+            del flights[flight.key]
+            if not flight.prefetch:
+                self._cancel_task(flight)
+        return True
+
+    def _is_busy(self):
+        """ Return True if no more flight can be started for now.
+
+        Batch flights are bounded by `max_batch_pending` instead, and are not
+        counted here.
+        """
+        if self.max_in_flight > 0:
+            in_flight = 0
+            for flights in (self._search_flights, self._download_flights):
+                for flight in flights.itervalues():
+                    if not flight.batch:
+                        in_flight += 1
+            if in_flight >= self.max_in_flight:
+                return True
+        if self.max_queued > 0 and \
+                self._scheduler.queued_counts.get(PRIORITY_INTERACTIVE, 0) >= self.max_queued:
+            return True
+        return False
+
+    def _check_batch(self, count, rejected):
+        """ Raise BusyError if `count` more batch tickets would exceed
+        `max_batch_pending`.
+
+        Arguments:
+        - `count`: The number of tickets in the batch.
+        - `rejected`: The counter of rejected requests to increase.
+        """
+        if self.max_batch_pending > 0 and \
+                len(self._search_batch_tickets) + len(self._download_batch_tickets) + \
+                count > self.max_batch_pending:
+            rejected.inc(count)
+            raise BusyError('Too many batch searches and downloads in progress')
+
+    def _join_flight(self, tasks, flight, ticket, priority, batch=False):
+        flight.tickets.add(ticket)
+        tasks[ticket] = flight
+        if not batch:
+            flight.batch = False
+        if priority == PRIORITY_INTERACTIVE:
+            self._promote_task(flight)
+
+    def _start_search(self, flight, metadata, priority):
+        """ Start the task of a search flight.
+        """
+        flight.task = Task(onfinish=lambda result: self.do_searchsuccess(self._app, flight, result),
+                           onerror=lambda e: self.do_searchfailure(self._app, flight, e),
+                           target=self._run_search,
+                           kwargs={'flight': flight, 'metadata': metadata},
+                           priority=priority,
+                           onstart=flight.start)
+        self._scheduler.submit(flight.task)
+
+    def _start_download(self, flight, downloadinfo, priority):
+        """ Start the task of a download flight.
+        """
+        flight.task = Task(onfinish=lambda content: self.do_downloadsuccess(self._app, flight, content),
+                           onerror=lambda e: self.do_downloadfailure(self._app, flight, e),
+                           target=self._download_and_store,
+                           kwargs={'downloadinfo': downloadinfo},
+                           priority=priority,
+                           onstart=flight.start)
+        self._scheduler.submit(flight.task)
+
+    def _cancel_task(self, flight):
+        """ Stop the task of a flight that no ticket waits for.
+        """
+        self._scheduler.cancel(flight.task)
+
+    def _promote_task(self, flight):
+        """ Make the task of a flight interactive.
+        """
+        if flight.task.priority != PRIORITY_INTERACTIVE:
+            self._scheduler.promote(flight.task)
+
+    def _parse_priority(self, options):
+        priority = options.get('priority', 'interactive')
+        if priority not in PRIORITY_NAMES:
+            raise ValueError('Unknown priority %s, expect one of %s' %
+                             (priority, ', '.join(PRIORITY_NAMES)))
+        return PRIORITY_NAMES[priority]
+
+    def _add_batch_completion(self, completions, completion):
+        completions.append(completion)
+        if not self._batch_flush_pending:
+            self._batch_flush_pending = True
+            self._app.run_on_main_thread(self._flush_batch_completions)
+
+    def _flush_batch_completions(self):
+        self._batch_flush_pending = False
+        if self._search_batch_completions:
+            completions = self._search_batch_completions
+            self._search_batch_completions = []
+            self.SearchBatchComplete(completions)
+        if self._download_batch_completions:
+            completions = self._download_batch_completions
+            self._download_batch_completions = []
+            self.DownloadBatchComplete(completions)
+
+    def _ticket_trace(self, kind, ticket):
+        """ Return the trace ID of a search or download ticket.
+        """
+        return '%s/%s/%d' % (self._id, kind, ticket)
+
+    def _start_flight(self, kind, ticket, start, flight, *args):
+        """ Call `start` with `flight` and `args` in the trace of the ticket
+        starting the flight, so that its tasks and requests are traced.
+        """
+        flight.trace = self._ticket_trace(kind, ticket)
+        with tracing.context(flight.trace):
+            start(flight, *args)
+        self._watch_flights()
+
+    def _watch_flights(self):
+        """ Start the watchdog timer if it is not running.
+
+        The timer checks running flights every quarter of `task_timeout`, and
+        stops when there are none left.
+        """
+        if self.task_timeout > 0 and self._watchdog is None:
+            self._watchdog = glib.timeout_add(int(self.task_timeout * 250),
+                                              self._reap_flights)
+
+    def _reap_flights(self):
+        """ Give up flights running for more than `task_timeout` seconds.
+        Time spent waiting for a worker thread does not count.
+
+        Their tasks are cancelled and their tickets complete as failed. A task
+        already running in a worker thread cannot be stopped, but its result is
+        dropped.
+        """
+        deadline = time.time() - self.task_timeout
+        for flight in [flight for flight in self._search_flights.itervalues()
+                       if flight.started is not None and flight.started < deadline]:
+            flight.reaped = True
+            self._search_reaped.inc()
+            self._cancel_task(flight)
+            logging.warning('Search timed out after %s seconds', self.task_timeout)
+            for ticket in self._land_flight(self._search_flights, self._search_tasks, flight):
+                self._complete_search(ticket, SEARCH_FAILED, _NO_RESULTS)
+        for flight in [flight for flight in self._download_flights.itervalues()
+                       if flight.started is not None and flight.started < deadline]:
+            flight.reaped = True
+            self._download_reaped.inc()
+            self._cancel_task(flight)
+            logging.warning('Download timed out after %s seconds', self.task_timeout)
+            if flight.prefetch:
+                self._prefetch_pending -= 1
+            for ticket in self._land_flight(self._download_flights, self._download_tasks, flight):
+                self._complete_download(ticket, DOWNLOAD_FAILED,
+                                        dbus.ByteArray('Timed out'))
+        if self._search_flights or self._download_flights:
+            return True
+        self._watchdog = None
+        return False
+
+    def _complete_search(self, ticket, status, results):
+        """ Send the _EncodedResults `results` of a ticket in the format it
+        asked for.
+        """
+        self._search_outcomes[status].inc()
+        trace = self._ticket_trace('search', ticket)
+        with tracing.context(trace):
+            with tracing.span('SearchComplete'):
+                if ticket in self._search_batch_tickets:
+                    self._search_batch_tickets.remove(ticket)
+                    self._add_batch_completion(self._search_batch_completions,
+                                               (ticket, status, results.dicts))
+                elif ticket in self._search_struct_tickets:
+                    self._search_struct_tickets.remove(ticket)
+                    self.SearchCompleteStruct(ticket, status, results.structs)
+                else:
+                    self.SearchComplete(ticket, status, results.dicts)
+        tracing.end('Search', trace, {'status': status})
+
+    @onmainthread
+    def do_searchprogress(self, flight, results):
+        tickets = [ticket for ticket in sorted(flight.tickets)
+                   if self._search_tasks.get(ticket) is flight and
+                   ticket not in self._search_batch_tickets]
+        if tickets:
+            results = _EncodedResults(results)
+            for ticket in tickets:
+                if ticket in self._search_struct_tickets:
+                    self.SearchProgressStruct(ticket, results.structs)
+                else:
+                    self.SearchProgress(ticket, results.dicts)
+
     @onmainthread
-    def do_searchsuccess(self, ticket, results):
-        if ticket in self._search_tasks:
-            del self._search_tasks[ticket]
-            dbusresults = [result.to_dict() for result in results]
-            self.SearchComplete(ticket, SEARCH_SUCCEED, dbusresults)
+    def do_searchsuccess(self, flight, results):
+        if flight.reaped:
+            return
+        self._search_latency.observe(time.time() - flight.started)
+        if results:
+            self._search_cache.set(flight.key, results)
+        tickets = self._land_flight(self._search_flights, self._search_tasks, flight)
+        if tickets:
+            encoded = _EncodedResults(results)
+            interactive = False
+            for ticket in tickets:
+                interactive = interactive or ticket not in self._search_batch_tickets
+                self._complete_search(ticket, SEARCH_SUCCEED, encoded)
+            if interactive:
+                self._prefetch(results)
 
     @onmainthread
-    def do_searchfailure(self, ticket, e):
-        if ticket in self._search_tasks:
-            del self._search_tasks[ticket]
+    def do_searchfailure(self, flight, e):
+        if flight.reaped:
+            return
+        self._search_latency.observe(time.time() - flight.started)
+        tickets = self._land_flight(self._search_flights, self._search_tasks, flight)
+        if tickets:
             logging.info('Search fail, %s' % e)
-            self.SearchComplete(ticket, SEARCH_FAILED, [])
+            for ticket in tickets:
+                self._complete_search(ticket, SEARCH_FAILED, _NO_RESULTS)
+
+    def _request_search(self, metadata, priority=PRIORITY_INTERACTIVE, batch=False,
+                        result_format='dict'):
+        ticket = self._search_count
+        self._search_count = self._search_count + 1
+        if batch:
+            self._search_batch_tickets.add(ticket)
+        elif result_format == 'struct':
+            self._search_struct_tickets.add(ticket)
+        if tracing.enabled:
+            tracing.begin('Search', self._ticket_trace('search', ticket),
+                          {'priority': priority, 'batch': batch})
+        metadata = Metadata.from_dict(metadata)
+        key = metadata.search_key()
+        results = self._search_cache.get(key)
+        if results is not None:
+            self._app.run_on_main_thread(self._complete_search,
+                                         (ticket, SEARCH_SUCCEED, _EncodedResults(results)))
+            return ticket
+        flight = self._search_flights.get(key)
+        if flight is None:
+            if not batch and self._is_busy():
+                self._search_rejected.inc()
+                self._search_struct_tickets.discard(ticket)
+                tracing.end('Search', self._ticket_trace('search', ticket),
+                            {'status': 'busy'})
+                raise BusyError('Too many searches and downloads in progress')
+            flight = _Flight(key, batch=batch)
+            self._search_flights[key] = flight
+            self._start_flight('search', ticket, self._start_search,
+                               flight, metadata, priority)
+        elif tracing.enabled:
+            tracing.record('join', time.time(), {'flight': flight.trace},
+                           id=self._ticket_trace('search', ticket))
+        self._join_flight(self._search_tasks, flight, ticket, priority, batch)
+        return ticket
 
     @dbus.service.method(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
                          in_signature='a{sv}',
                          out_signature='i')
     def Search(self, metadata):
-        ticket = self._search_count
-        self._search_count = self._search_count + 1
-        thread = BaseTaskThread(onfinish=lambda result: self.do_searchsuccess(self._app, ticket, result),
-                                onerror=lambda e: self.do_searchfailure(self._app, ticket, e),
-                                target=self.do_search,
-                                kwargs={'metadata': Metadata.from_dict(metadata)})
-        self._search_tasks[ticket] = thread
-        thread.start()
-        return ticket
+        return self._request_search(metadata)
+
+    @dbus.service.method(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                         in_signature='a{sv}a{sv}',
+                         out_signature='i')
+    def SearchWithOptions(self, metadata, options):
+        """ Same as `Search`, with a dict of options.
+
+        Supported options:
+
+        - `priority`: (string) `'interactive'` (default) for a track a user is
+          waiting for, or `'background'` for bulk work. Interactive searches
+          always run first.
+        - `result-format`: (string) `'dict'` (default) to receive results with
+          `SearchProgress` and `SearchComplete`, or `'struct'` to receive them
+          with `SearchProgressStruct` and `SearchCompleteStruct`, which are
+          smaller and cheaper to marshal.
+        """
+        result_format = options.get('result-format', 'dict')
+        if result_format not in RESULT_FORMATS:
+            raise ValueError('Unknown result format %s, expect one of %s' %
+                             (result_format, ', '.join(RESULT_FORMATS)))
+        return self._request_search(metadata, priority=self._parse_priority(options),
+                                    result_format=result_format)
+
+    @dbus.service.method(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                         in_signature='aa{sv}',
+                         out_signature='ai')
+    def SearchBatch(self, metadatas):
+        """ Search for many tracks at once.
+
+        Returns a list of tickets in the same order as `metadatas`. The searches
+        run as background tasks, and completions are reported together with
+        the `SearchBatchComplete` signal instead of `SearchComplete`.
+
+        If the plugin has too many batch tickets pending, the whole call fails
+        with `org.lyricsource.Error.Busy` and no search is started.
+        """
+        self._check_batch(len(metadatas), self._search_rejected)
+        return [self._request_search(metadata, priority=PRIORITY_BACKGROUND, batch=True)
+                for metadata in metadatas]
 
     @dbus.service.method(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
                          in_signature='i',
                          out_signature='')
     def CancelSearch(self, ticket):
-        if ticket in self._search_tasks:
-            del self._search_tasks[ticket]
-            self.SearchComplete(ticket, SEARCH_CANCELLED, [])
+        if self._cancel_ticket(self._search_flights, self._search_tasks, ticket):
+            self._complete_search(ticket, SEARCH_CANCELLED, _NO_RESULTS)
 
 
     def do_download(self, downloadinfo):
@@ -224,49 +800,329 @@ class BaseLyricSourcePlugin(DBusObject):
         - `downloadinfo`: The additional info taken from `downloadinfo` field in
           SearchResult objects.
 
-        Returns: A string of the lyric content
+        Returns: A string of the lyric content. Return the raw bytes rather
+        than decoded text, so that the content can be sent as is.
         """
         raise NotImplementedError()
 
+    def _download_store_key(self, downloadinfo):
+        return repr((self._id, _freeze(downloadinfo)))
+
+    def _download_and_store(self, downloadinfo):
+        """ Run `do_download` and save the lyric in the download store.
+
+        This method runs in the task thread.
+        """
+        content = _to_bytes(self.do_download(downloadinfo))
+        if self._download_store is not None:
+            self._store_download(downloadinfo, content)
+        return content
+
+    def _store_download(self, downloadinfo, content):
+        """ Save a downloaded lyric in the download store.
+
+        Lyrics with the same timeline as a stored one, usually the same file
+        from another source, are counted in `CacheStats`. This method runs in a
+        task thread.
+        """
+        if self._download_store.put(self._download_store_key(downloadinfo),
+                                    content, fingerprint(content)):
+            self._app.run_on_main_thread(self._download_store_equivalent.inc)
+
+    def _complete_download(self, ticket, status, content):
+        self._download_outcomes[status].inc()
+        fd_threshold = self._download_fd_thresholds.pop(ticket, None)
+        trace = self._ticket_trace('download', ticket)
+        with tracing.context(trace):
+            with tracing.span('DownloadComplete', {'size': len(content)}):
+                if ticket in self._download_batch_tickets:
+                    self._download_batch_tickets.remove(ticket)
+                    self._add_batch_completion(self._download_batch_completions,
+                                               (ticket, status, content))
+                elif fd_threshold is not None and status == DOWNLOAD_SUCCEED and \
+                        len(content) >= fd_threshold:
+                    f = memory_file(content)
+                    try:
+                        self.DownloadCompleteFd(ticket, status, dbus.UnixFd(f))
+                    except Exception as e:
+                        logging.warning('Cannot send download %d as a file descriptor: %s',
+                                        ticket, e)
+                        self.DownloadComplete(ticket, status, content)
+                    finally:
+                        f.close()
+                else:
+                    self.DownloadComplete(ticket, status, content)
+        tracing.end('Download', trace, {'status': status})
+
+    def _prefetch(self, results):
+        """ Download the top `prefetch_count` results in background.
+        """
+        for result in results[:self.prefetch_count]:
+            if self._prefetch_pending >= self.prefetch_max_pending or \
+                    self._is_busy():
+                break
+            downloadinfo = result._downloadinfo
+            key = _freeze(downloadinfo)
+            if key in self._download_flights or key in self._prefetch_buffer:
+                continue
+            if self._download_store is not None and \
+                    self._download_store.get(self._download_store_key(downloadinfo)) is not None:
+                continue
+            flight = _Flight(key, prefetch=True)
+            self._download_flights[key] = flight
+            self._prefetch_pending += 1
+            self._prefetch_issued += 1
+            self._start_download(flight, downloadinfo, PRIORITY_BACKGROUND)
+            self._watch_flights()
+
+    def _use_prefetch(self, key):
+        """ Return the prefetched content of `key`, or None if not prefetched.
+        """
+        entry = self._prefetch_buffer.get(key)
+        if entry is None:
+            return None
+        if not entry[1]:
+            entry[1] = True
+            self._prefetch_hits += 1
+        return entry[0]
+
     @onmainthread
-    def do_downloadsuccess(self, ticket, content):
-        if ticket in self._download_tasks:
-            del self._download_tasks[ticket]
-            self.DownloadComplete(ticket, DOWNLOAD_SUCCEED, str(content))
+    def do_downloadsuccess(self, flight, content):
+        if flight.reaped:
+            return
+        self._download_latency.observe(time.time() - flight.started)
+        if flight.prefetch:
+            self._prefetch_pending -= 1
+            self._prefetch_buffer.set(flight.key, [content, bool(flight.tickets)])
+            if flight.tickets:
+                self._prefetch_hits += 1
+        tickets = self._land_flight(self._download_flights, self._download_tasks, flight)
+        for ticket in tickets:
+            self._complete_download(ticket, DOWNLOAD_SUCCEED, content)
 
     @onmainthread
-    def do_downloadfailure(self, ticket, e):
-        if ticket in self._download_tasks:
-            del self._download_tasks[ticket]
-            self.DownloadComplete(ticket, DOWNLOAD_FAILED, str(e))
+    def do_downloadfailure(self, flight, e):
+        if flight.reaped:
+            return
+        self._download_latency.observe(time.time() - flight.started)
+        if flight.prefetch:
+            self._prefetch_pending -= 1
+        tickets = self._land_flight(self._download_flights, self._download_tasks, flight)
+        for ticket in tickets:
+            self._complete_download(ticket, DOWNLOAD_FAILED, dbus.ByteArray(str(e)))
+
+    def _request_download(self, downloadinfo, priority=PRIORITY_INTERACTIVE, batch=False,
+                          fd_threshold=None):
+        ticket = self._download_count
+        self._download_count = self._download_count + 1
+        if batch:
+            self._download_batch_tickets.add(ticket)
+        if fd_threshold is not None:
+            self._download_fd_thresholds[ticket] = fd_threshold
+        if tracing.enabled:
+            tracing.begin('Download', self._ticket_trace('download', ticket),
+                          {'priority': priority, 'batch': batch})
+        key = _freeze(downloadinfo)
+        content = self._use_prefetch(key)
+        if content is not None:
+            self._app.run_on_main_thread(self._complete_download,
+                                         (ticket, DOWNLOAD_SUCCEED, content))
+            return ticket
+        if self._download_store is not None:
+            content = self._download_store.get(self._download_store_key(downloadinfo))
+            if content is None:
+                self._download_store_misses.inc()
+            else:
+                self._download_store_hits.inc()
+                self._app.run_on_main_thread(self._complete_download,
+                                             (ticket, DOWNLOAD_SUCCEED,
+                                              dbus.ByteArray(content)))
+                return ticket
+        flight = self._download_flights.get(key)
+        if flight is None:
+            if not batch and self._is_busy():
+                self._download_rejected.inc()
+                self._download_fd_thresholds.pop(ticket, None)
+                tracing.end('Download', self._ticket_trace('download', ticket),
+                            {'status': 'busy'})
+                raise BusyError('Too many searches and downloads in progress')
+            flight = _Flight(key, batch=batch)
+            self._download_flights[key] = flight
+            self._start_flight('download', ticket, self._start_download,
+                               flight, downloadinfo, priority)
+        elif tracing.enabled:
+            tracing.record('join', time.time(), {'flight': flight.trace},
+                           id=self._ticket_trace('download', ticket))
+        self._join_flight(self._download_tasks, flight, ticket, priority, batch)
+        return ticket
 
     @dbus.service.method(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
                          in_signature='v',
                          out_signature='i')
     def Download(self, downloadinfo):
-        ticket = self._download_count
-        self._download_count = self._download_count + 1
-        thread = BaseTaskThread(onfinish=lambda content: self.do_downloadsuccess(self._app, ticket, content),
-                                onerror=lambda e: self.do_downloadfailure(self._app, ticket, e),
-                                target=self.do_download,
-                                kwargs={'downloadinfo': downloadinfo})
-        self._download_tasks[ticket] = thread
-        thread.start()
-        return ticket
+        return self._request_download(downloadinfo)
+
+    @dbus.service.method(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                         in_signature='va{sv}',
+                         out_signature='i')
+    def DownloadWithOptions(self, downloadinfo, options):
+        """ Same as `Download`, with a dict of options.
+
+        Supported options are the same as `SearchWithOptions`, and:
+
+        - `fd-threshold`: (integer) If the lyric is at least this many bytes, it
+          is sent with the `DownloadCompleteFd` signal as a file descriptor
+          instead of `DownloadComplete`. The bus connection must support
+          passing file descriptors. If the descriptor cannot be sent, the
+          lyric is sent with `DownloadComplete` instead, so clients must
+          handle both signals. The signal is received by every client
+          listening to it, and all of them share the file offset, so read the
+          file with `pread` from offset 0, or seek to 0 before reading.
+        """
+        fd_threshold = options.get('fd-threshold')
+        if fd_threshold is not None:
+            fd_threshold = int(fd_threshold)
+        return self._request_download(downloadinfo,
+                              priority=self._parse_priority(options),
+                              fd_threshold=fd_threshold)
+
+    @dbus.service.method(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                         in_signature='av',
+                         out_signature='ai')
+    def DownloadBatch(self, downloadinfos):
+        """ Download many lyrics at once.
+
+        Returns a list of tickets in the same order as `downloadinfos`. The
+        downloads run as background tasks, and completions are reported
+        together with the `DownloadBatchComplete` signal instead of
+        `DownloadComplete`.
+
+        If the plugin has too many batch tickets pending, the whole call fails
+        with `org.lyricsource.Error.Busy` and no download is started.
+        """
+        self._check_batch(len(downloadinfos), self._download_rejected)
+        return [self._request_download(downloadinfo, priority=PRIORITY_BACKGROUND,
+                               batch=True)
+                for downloadinfo in downloadinfos]
 
     @dbus.service.method(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
                          in_signature='i',
                          out_signature='')
     def CancelDownload(self, ticket):
-        if ticket in self._download_tasks:
-            del self._download_tasks[ticket]
-            self.DownloadComplete(ticket, DOWNLOAD_CANCELLED, '')
+        if self._cancel_ticket(self._download_flights, self._download_tasks, ticket):
+            self._complete_download(ticket, DOWNLOAD_CANCELLED, dbus.ByteArray(''))
 
     @dbus_property(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
                   type_signature='s')
     def Name(self):
         return self._name
 
+    @dbus_property(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                   type_signature='a{sv}',
+                   emit_change=False)
+    def PrefetchStats(self):
+        """ Statistics of prefetched downloads.
+
+        `issued` prefetches were started and `hits` of them were requested by
+        `Download` later. `hit_rate` is the ratio of the two.
+        """
+        return {'issued': dbus.UInt32(self._prefetch_issued),
+                'hits': dbus.UInt32(self._prefetch_hits),
+                'pending': dbus.UInt32(self._prefetch_pending),
+                'hit_rate': dbus.Double(float(self._prefetch_hits) / self._prefetch_issued
+                                        if self._prefetch_issued else 0.0)}
+
+    def _http_client(self):
+        """ Return the AsyncHTTPClient whose transfers are reported in
+        metrics, or None.
+        """
+        return None
+
+    @dbus_property(dbus_interface=METRICS_INTERFACE,
+                   type_signature='a{su}',
+                   emit_change=False)
+    def InFlight(self):
+        """ The number of searches and downloads running, tickets waiting for
+        them, and HTTP transfers in progress.
+        """
+        http = self._http_client()
+        return {'searches': dbus.UInt32(len(self._search_flights)),
+                'downloads': dbus.UInt32(len(self._download_flights)),
+                'search_tickets': dbus.UInt32(len(self._search_tasks)),
+                'download_tickets': dbus.UInt32(len(self._download_tasks)),
+                'http': dbus.UInt32(http.active_count if http is not None else 0)}
+
+    @dbus_property(dbus_interface=METRICS_INTERFACE,
+                   type_signature='a{su}',
+                   emit_change=False)
+    def QueueDepth(self):
+        """ The number of tasks waiting for a worker thread, by priority.
+        """
+        counts = self._scheduler.queued_counts
+        return dict((name, dbus.UInt32(counts[priority]))
+                    for name, priority in PRIORITY_NAMES.iteritems())
+
+    @dbus_property(dbus_interface=METRICS_INTERFACE,
+                   type_signature='a{sa{su}}',
+                   emit_change=False)
+    def Outcomes(self):
+        """ The number of completed search and download tickets by status, of
+        requests rejected because the plugin was busy, and of tasks given up
+        after `task_timeout`.
+        """
+        def outcomes(counters, rejected, reaped):
+            return {'succeeded': dbus.UInt32(counters[SEARCH_SUCCEED].value),
+                    'cancelled': dbus.UInt32(counters[SEARCH_CANCELLED].value),
+                    'failed': dbus.UInt32(counters[SEARCH_FAILED].value),
+                    'rejected': dbus.UInt32(rejected.value),
+                    'reaped': dbus.UInt32(reaped.value)}
+        return {'search': outcomes(self._search_outcomes, self._search_rejected,
+                                   self._search_reaped),
+                'download': outcomes(self._download_outcomes, self._download_rejected,
+                                     self._download_reaped)}
+
+    @dbus_property(dbus_interface=METRICS_INTERFACE,
+                   type_signature='a{sa{sd}}',
+                   emit_change=False)
+    def Latency(self):
+        """ Estimated percentiles in seconds of the time searches, downloads
+        and HTTP transfers take.
+
+        Each item has `count`, `p50`, `p95` and `p99`. Searches and downloads
+        are measured once for all tickets sharing them, from the time a worker
+        starts the task, so time waiting in the queue is not included. Results
+        served from caches are not included either.
+        """
+        latency = {'search': self._search_latency.summary(),
+                   'download': self._download_latency.summary()}
+        http = self._http_client()
+        if http is not None:
+            latency['http'] = http.latency.summary()
+        return latency
+
+    @dbus_property(dbus_interface=METRICS_INTERFACE,
+                   type_signature='a{sa{sd}}',
+                   emit_change=False)
+    def CacheStats(self):
+        """ Hits, misses and hit ratios of the search cache and the download
+        store.
+
+        The download store also reports `equivalent`, the number of downloaded
+        lyrics with the same timeline as a different lyric already stored,
+        usually the same file from another source or another result.
+        """
+        def stats(hits, misses):
+            total = hits + misses
+            return {'hits': hits,
+                    'misses': misses,
+                    'hit_ratio': float(hits) / total if total else 0.0}
+        store = stats(self._download_store_hits.value,
+                      self._download_store_misses.value)
+        store['equivalent'] = self._download_store_equivalent.value
+        return {'search_cache': stats(self._search_cache.hits,
+                                      self._search_cache.misses),
+                'download_store': store}
+
     @dbus.service.signal(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
                          signature='iiaa{sv}')
     def SearchComplete(self, ticket, status, results):
@@ -274,12 +1130,73 @@ class BaseLyricSourcePlugin(DBusObject):
         pass
 
 
+    @dbus.service.signal(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                         signature='iaa{sv}')
+    def SearchProgress(self, ticket, results):
+        """ Reports partial results of a search that is not complete yet.
+
+        The results are sent again in `SearchComplete`, which closes the ticket.
+        """
+        logging.debug('search progress: ticket: %d, %d results' % (ticket, len(results)))
+
+    @dbus.service.signal(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                         signature='iia(' + RESULT_STRUCT_SIGNATURE + ')')
+    def SearchCompleteStruct(self, ticket, status, results):
+        """ Same as `SearchComplete`, for searches with the `result-format`
+        option set to `'struct'`.
+
+        Each result is a struct of `RESULT_STRUCT_FIELDS`, in that order, rather
+        than a dict.
+        """
+        logging.debug('search complete: ticket: %d, status: %d' % (ticket, status))
+
+    @dbus.service.signal(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                         signature='ia(' + RESULT_STRUCT_SIGNATURE + ')')
+    def SearchProgressStruct(self, ticket, results):
+        """ Same as `SearchProgress`, for searches with the `result-format`
+        option set to `'struct'`.
+        """
+        logging.debug('search progress: ticket: %d, %d results' % (ticket, len(results)))
+
     @dbus.service.signal(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
                          signature='iiay')
     def DownloadComplete(self, ticket, status, result):
         logging.debug('download complete: ticket: %d, status: %d' % (ticket, status), '' if status == DOWNLOAD_SUCCEED else ', result: %s' % result)
         pass
 
+    @dbus.service.signal(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                         signature='iih')
+    def DownloadCompleteFd(self, ticket, status, fd):
+        """ Reports a successful download requested with the `fd-threshold`
+        option whose lyric is large.
+
+        The lyric is the content of the file `fd` from its beginning to the
+        end of file. The file offset is shared by every process receiving the
+        signal, so read it with `pread` from offset 0, or seek to 0 before
+        reading.
+        """
+        logging.debug('download complete with fd: ticket: %d, status: %d' % (ticket, status))
+
+    @dbus.service.signal(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                         signature='a(iiaa{sv})')
+    def SearchBatchComplete(self, completions):
+        """ Reports searches started by `SearchBatch` that are complete.
+
+        Each completion is a struct of ticket, status and results, the same as
+        the arguments of `SearchComplete`.
+        """
+        logging.debug('search batch complete: %d tickets' % len(completions))
+
+    @dbus.service.signal(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                         signature='a(iiay)')
+    def DownloadBatchComplete(self, completions):
+        """ Reports downloads started by `DownloadBatch` that are complete.
+
+        Each completion is a struct of ticket, status and content, the same as
+        the arguments of `DownloadComplete`.
+        """
+        logging.debug('download batch complete: %d tickets' % len(completions))
+
     def run(self):
         """
         Run the plugin as a standalone application
@@ -304,6 +1221,121 @@ class BaseLyricSourcePlugin(DBusObject):
     def config_proxy(self):
         return None
 
+class AsyncLyricSourcePlugin(BaseLyricSourcePlugin):
+    """ Base class for lyric source plugins that never block.
+
+    Instead of blocking methods run in threads, `do_search` and `do_download`
+    are generator-based coroutines run in the main loop (see
+    lyricsources.coroutine). They yield the Futures returned by `http.fetch`
+    to wait for HTTP responses without blocking, so one process can serve a
+    lot of concurrent requests with no worker threads::
+
+      class MySource(AsyncLyricSourcePlugin):
+
+          def do_search(self, metadata):
+              status, content = yield self.http.fetch(SEARCH_URL + metadata.title)
+              yield parse_results(content)
+
+          def do_download(self, downloadinfo):
+              status, content = yield self.http.fetch(downloadinfo)
+              raise Return(content)
+
+    Priorities are not needed since requests do not wait for threads.
+    """
+
+    def do_search(self, metadata):
+        """
+        Do the real search work by plugins. All plugins MUST implement this
+        method as a coroutine.
+
+        The coroutine yields lists of SearchResult objects as soon as they are
+        ready. Each list is sent with the `SearchProgress` signal, and
+        `SearchComplete` is sent with all of them when the coroutine ends.
+
+        Parameters:
+
+        - `metadata`: The metadata of the track to search. The type of `metadata`
+          is lyricsource.metadata.Metadata
+        """
+        raise NotImplementedError()
+
+    def do_download(self, downloadinfo):
+        """
+        Do the real download work by plugins. All plugins MUST implement this
+        method as a coroutine.
+
+        The coroutine returns the lyric content with `raise Return(content)`.
+
+        Parameters:
+
+        - `downloadinfo`: The additional info taken from `downloadinfo` field in
+          SearchResult objects.
+        """
+        raise NotImplementedError()
+
+    @property
+    def http(self):
+        """
+        The lyricsources.asynchttp.AsyncHTTPClient to download contents.
+        """
+        return self._app.http_client
+
+    def _http_client(self):
+        return self.http
+
+    def _start_search(self, flight, metadata, priority):
+        results = []
+
+        def on_yield(partial):
+            partial = list(partial)
+            if partial:
+                results.extend(partial)
+                self.do_searchprogress(self._app, flight,
+                                       self.rank_results(metadata, partial))
+
+        def on_done(future):
+            if future.cancelled():
+                return
+            if future.exc_info() is not None:
+                logging.error('Search failed', exc_info=future.exc_info())
+                self.do_searchfailure(self._app, flight, future.exc_info()[1])
+            else:
+                self.do_searchsuccess(self._app, flight,
+                                      self.rank_results(metadata, results))
+
+        flight.start()
+        flight.task = run_coroutine(self.do_search(metadata), on_yield)
+        flight.task.add_done_callback(on_done)
+
+    def _start_download(self, flight, downloadinfo, priority):
+        def on_done(future):
+            if future.cancelled():
+                return
+            if future.exc_info() is not None:
+                logging.error('Download failed', exc_info=future.exc_info())
+                self.do_downloadfailure(self._app, flight, future.exc_info()[1])
+                return
+            content = _to_bytes(future.result())
+            if self._download_store is not None:
+                # Keep disk writes out of the main loop
+                self._scheduler.submit(Task(onfinish=lambda ret: None,
+                                            onerror=lambda e: None,
+                                            target=self._store_download,
+                                            args=(downloadinfo, content),
+                                            priority=PRIORITY_BACKGROUND))
+            self.do_downloadsuccess(self._app, flight, content)
+
+        flight.start()
+        flight.task = run_coroutine(self.do_download(downloadinfo))
+        flight.task.add_done_callback(on_done)
+
+    def _cancel_task(self, flight):
+        flight.task.cancel()
+
+    def _promote_task(self, flight):
+        pass
+
+
 def test():
     class DummyLyricSourcePlugin(BaseLyricSourcePlugin):
         def __init__(self):
@@ -374,9 +1406,9 @@ def test():
             return
         if status == 0:
             logging.debug('Download #%d success', ticket)
-            logging.debug('Downloaded content: \n%s', ''.join([chr(b) for b in content]))
+            logging.debug('Downloaded content: \n%s', str(content))
         else:
-            logging.warning('Download #%d fail, msg: %s', ticket, ''.join([chr(b) for b in content]))
+            logging.warning('Download #%d fail, msg: %s', ticket, str(content))
         del download_tickets[ticket]
         check_quit()
 
@@ -398,7 +1430,8 @@ def test():
     source.connect_to_signal('SearchComplete',
                              search_complete_cb)
     source.connect_to_signal('DownloadComplete',
-                             download_complete_cb)
+                             download_complete_cb,
+                             byte_arrays=True)
     source.Search({'title': 'dummytitle',
                    'artist': 'dummyartist',
                    'album': 'dummyalbum'},
@@ -35,7 +35,8 @@ class Metadata(object):
 
     Metadata provides following properties: `title`, `artist`, `album`, `location`,
     `arturl`, `length`, and `tracknum`, where `length` and `tracknum` are integers,
-    the others are strings.
+    the others are strings. `length` is in milliseconds. MPRIS2 dicts give it in
+    microseconds, and are converted.
     """
 
     # Possible MPRIS metadata keys, taken from
@@ -74,7 +75,7 @@ class Metadata(object):
         - `arturl`: (string) The URI of the picture of the cover of the album
         - `tracknum`: (int) The number of the track
         - `location`: (string) The URI of the file
-        - `length`: (int) The duration of the track
+        - `length`: (int) The duration of the track in milliseconds
         - `extra`: (dict) A dict that is intend to store additional properties
                    provided by MPRIS1 or MPRIS2 DBus dicts. The MPRIS1-related
                    values will be set in the dict returned by `to_mpris1`. The
@@ -131,7 +132,7 @@ class Metadata(object):
         >>> print dict['mpris:artUrl']
         file:///art/url
         >>> print dict['mpris:length']
-        123
+        123000
         >>> print dict['xesam:trackNumber']
         456
         >>> print dict['xesam:userRating']
@@ -160,7 +161,7 @@ class Metadata(object):
         if self.artist is not None:
             ret['xesam:artist'] = [dbus.String(v.strip()) for v in self.artist.split(',')]
         if self.length >= 0:
-            ret['mpris:length'] = dbus.Int64(self.length)
+            ret['mpris:length'] = dbus.Int64(self.length * 1000)
         if self.tracknum >= 0:
             ret['xesam:trackNumber'] = dbus.Int32(self.tracknum)
         for k, v in self._extra.items():
@@ -189,7 +190,7 @@ class Metadata(object):
         if 'xesam:trackNumber' in mpris2_dict:
             kargs['tracknum'] = int(mpris2_dict['xesam:trackNumber'])
         if 'mpris:length' in mpris2_dict:
-            kargs['length'] = int(mpris2_dict['mpris:length'])
+            kargs['length'] = int(mpris2_dict['mpris:length']) / 1000
         ret = Metadata(**kargs)
         ret._extra = mpris2_dict
         return ret
@@ -304,13 +305,37 @@ class Metadata(object):
         if 'mtime' in dbusdict:
             kargs['length'] = dbusdict['mtime']
         elif 'mpris:length' in dbusdict:
-            kargs['length'] = int(dbusdict['mpris:length'])
+            kargs['length'] = int(dbusdict['mpris:length']) / 1000
         elif 'time' in dbusdict:
             kargs['length'] = dbusdict['time'] * 1000
         ret = Metadata(**kargs)
         ret._extra = dbusdict
         return ret
 
+    def search_key(self):
+        """
+        Return a hashable key that identifies the track to search.
+
+        Title, artist and album are compared case-insensitively, with
+        whitespaces collapsed. Two Metadata objects with the same key are
+        expected to get the same search results.
+
+        >>> md1 = Metadata(title=' Some  Title', artist='ARTIST', length=1000)
+        >>> md2 = Metadata(title='some title', artist='Artist ', length=1000)
+        >>> md1.search_key() == md2.search_key()
+        True
+        >>> md1.search_key() == Metadata(title='some title').search_key()
+        False
+        """
+        def normalize(value):
+            if not value:
+                return u''
+            return u' '.join(utils.ensure_unicode(value).split()).lower()
+        return (normalize(self.title),
+                normalize(self.artist),
+                normalize(self.album),
+                int(self.length))
+
     def __str__(self):
         attrs = ['title', 'artist', 'album', 'location', 'length']
         attr_value = ['  %s: %s' % (key, getattr(self, key)) for key in attrs]
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import bisect
+
+__all__ = (
+    'Counter',
+    'Histogram',
+    )
+
+# Upper bounds in seconds of the buckets of latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60)
+
+
+class Counter(object):
+    """ A number that only goes up.
+
+    Metrics are updated in the main thread, so no lock is taken.
+
+    >>> c = Counter()
+    >>> c.inc()
+    >>> c.inc(2)
+    >>> c.value
+    3
+    """
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class Histogram(object):
+    """ Counts of observed values in fixed buckets.
+
+    Observing a value costs a binary search and an increment, and memory
+    doesn't grow with the number of values. Percentiles are estimated by
+    interpolating in the bucket they fall in. Like Counter, it is updated in
+    the main thread without locks.
+
+    >>> h = Histogram(buckets=(1, 2, 4))
+    >>> for value in (0.5, 1.5, 1.5, 3, 10):
+    ...     h.observe(value)
+    >>> h.count, h.sum
+    (5, 16.5)
+    >>> h.percentile(50)
+    1.75
+    >>> h.percentile(99)
+    10
+    >>> Histogram().percentile(50)
+    0.0
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+
+        Arguments:
+        - `buckets`: (optional) The sorted upper bounds of buckets. Values
+          larger than the last bound are counted in an extra bucket.
+        """
+        self._bounds = tuple(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """ Return an estimate of the `p`-th percentile, or 0.0 if no value is
+        observed.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, count in enumerate(self._counts):
+            if count > 0 and seen + count >= rank:
+                if i == len(self._bounds):
+                    return self.max
+                lower = self._bounds[i - 1] if i > 0 else 0.0
+                upper = min(self._bounds[i], self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def summary(self):
+        """ Return a dict of the count and the 50th, 95th and 99th percentiles.
+        """
+        return {'count': self.count,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99)}
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import math
+import re
+import unicodedata
+
+from .utils import ensure_unicode
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = (
+    'rank',
+    'score',
+    )
+
+# Size of the hashed character bigram vectors. Must be a power of 2.
+FEATURE_SIZE = 1024
+# Weights of title, artist, album and duration in the score
+WEIGHTS = (0.45, 0.3, 0.1, 0.15)
+# Durations differing by this many milliseconds or more don't agree at all
+LENGTH_TOLERANCE = 10 * 1000
+# Durations differing by this factor or more are most likely in different
+# units, such as microseconds and milliseconds, and are ignored like unknown
+# durations
+LENGTH_MAX_RATIO = 100
+# The NumPy backend is used for at least this many candidates. Below that,
+# converting to arrays costs more than it saves.
+NUMPY_THRESHOLD = 64
+
+_NOT_ALNUM_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize(text):
+    """ Return the lower-case letters and digits in `text` as a unicode string,
+    without diacritics.
+
+    >>> normalize(' The  Song (Live)')
+    u'thesonglive'
+    >>> normalize(u'\\uff21\\uff22C Caf\\xe9')
+    u'abccafe'
+    >>> normalize(None)
+    u''
+    """
+    if not text:
+        return u''
+    # Diacritics are combining characters after NFKD, so they are removed too
+    return _NOT_ALNUM_RE.sub(u'', unicodedata.normalize('NFKD', ensure_unicode(text)).lower())
+
+
+def _features(text):
+    """ Return the hashed character bigrams of normalized `text`.
+    """
+    if len(text) < 2:
+        return [hash(text) & (FEATURE_SIZE - 1)] if text else []
+    return [hash(text[i:i + 2]) & (FEATURE_SIZE - 1)
+            for i in xrange(len(text) - 1)]
+
+
+def _counts(features):
+    counts = {}
+    for feature in features:
+        counts[feature] = counts.get(feature, 0) + 1
+    return counts
+
+
+def _similarities_python(query, texts):
+    """ Return the cosine similarities of bigram vectors of `query` and each of
+    `texts`.
+    """
+    query = _counts(_features(query))
+    qnorm = math.sqrt(sum(v * v for v in query.itervalues()))
+    ret = []
+    for text in texts:
+        counts = _counts(_features(text))
+        dot = sum(query.get(k, 0) * v for k, v in counts.iteritems())
+        norm = math.sqrt(sum(v * v for v in counts.itervalues())) * qnorm
+        ret.append(dot / norm if norm > 0 else 0.0)
+    return ret
+
+
+def _similarities_numpy(query, texts):
+    """ Same as `_similarities_python`, with sparse NumPy arrays.
+    """
+    rows = []
+    cols = []
+    cache = {}
+    for row, text in enumerate(texts):
+        features = cache.get(text)
+        if features is None:
+            features = cache[text] = _features(text)
+        rows.extend([row] * len(features))
+        cols.extend(features)
+    n = len(texts)
+    qvec = numpy.bincount(numpy.array(_features(query), dtype=numpy.intp),
+                          minlength=FEATURE_SIZE).astype(numpy.float64)
+    flat = numpy.array(rows, dtype=numpy.intp) * FEATURE_SIZE + \
+        numpy.array(cols, dtype=numpy.intp)
+    cells, counts = numpy.unique(flat, return_counts=True)
+    cellrows = cells // FEATURE_SIZE
+    counts = counts.astype(numpy.float64)
+    dots = numpy.bincount(cellrows, weights=counts * qvec[cells % FEATURE_SIZE],
+                          minlength=n)
+    norms = numpy.sqrt(numpy.bincount(cellrows, weights=counts * counts,
+                                      minlength=n)) * numpy.sqrt(qvec.dot(qvec))
+    return numpy.where(norms > 0, dots / numpy.maximum(norms, 1e-12), 0.0)
+
+
+def _length_agreement(query, length):
+    """ Return how well the durations `query` and `length` agree, from 0.0 to
+    1.0, or None if either is unknown.
+
+    >>> _length_agreement(125000, 130000)
+    0.5
+    >>> _length_agreement(125000, 125000000) is None
+    True
+    """
+    if query <= 0 or length <= 0:
+        return None
+    if max(query, length) >= min(query, length) * LENGTH_MAX_RATIO:
+        return None
+    return 1.0 - float(min(abs(query - length), LENGTH_TOLERANCE)) / LENGTH_TOLERANCE
+
+
+def score(metadata, candidates, use_numpy=None):
+    """ Return how well each candidate matches the track, from 0.0 to 1.0.
+
+    The score is a weighted sum of similarities of title, artist and album
+    plus agreement of durations. Fields missing in `metadata`, and durations
+    missing in a candidate, are left out of the sum. So are durations too far
+    apart to be in the same unit.
+
+    Arguments:
+    - `metadata`: A lyricsources.metadata.Metadata object of the track.
+    - `candidates`: A list of (title, artist, album, length) tuples. `length`
+      is in milliseconds, and is not positive if unknown.
+    - `use_numpy`: (optional) Whether to compute with NumPy. By default NumPy
+      is used if it is installed and there are many candidates.
+
+    >>> from .metadata import Metadata
+    >>> track = Metadata(title='Yesterday', artist='The Beatles', length=125000)
+    >>> candidates = [('Yesterday', 'Beatles', '', 126000),
+    ...               ('Yesterday Once More', 'Carpenters', '', 230000),
+    ...               ('Let It Be', 'The Beatles', '', -1)]
+    >>> ['%.2f' % s for s in score(track, candidates, use_numpy=False)]
+    ['0.92', '0.35', '0.40']
+    >>> if numpy is not None:
+    ...     numpy.allclose(score(track, candidates, use_numpy=True),
+    ...                    score(track, candidates, use_numpy=False))
+    ... else:
+    ...     True
+    True
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None and len(candidates) >= NUMPY_THRESHOLD
+    similarities = _similarities_numpy if use_numpy else _similarities_python
+    fields = [normalize(metadata.title), normalize(metadata.artist),
+              normalize(metadata.album)]
+    totals = [0.0] * len(candidates)
+    weights = [0.0] * len(candidates)
+    if use_numpy:
+        totals = numpy.array(totals)
+        weights = numpy.array(weights)
+    # Sources often return the same artist or album for many results
+    normalized = {}
+    for i, query in enumerate(fields):
+        if not query:
+            continue
+        texts = []
+        for candidate in candidates:
+            text = candidate[i]
+            if text not in normalized:
+                normalized[text] = normalize(text)
+            texts.append(normalized[text])
+        sims = similarities(query, texts)
+        if use_numpy:
+            totals += WEIGHTS[i] * sims
+            weights += WEIGHTS[i]
+        else:
+            for j, sim in enumerate(sims):
+                totals[j] += WEIGHTS[i] * sim
+                weights[j] += WEIGHTS[i]
+    for j, candidate in enumerate(candidates):
+        agreement = _length_agreement(metadata.length, candidate[3])
+        if agreement is not None:
+            totals[j] += WEIGHTS[3] * agreement
+            weights[j] += WEIGHTS[3]
+    if use_numpy:
+        return list(numpy.where(weights > 0, totals / numpy.maximum(weights, 1e-12), 0.0))
+    return [total / weight if weight > 0 else 0.0
+            for total, weight in zip(totals, weights)]
+
+
+def rank(metadata, candidates, use_numpy=None):
+    """ Return the indexes of `candidates`, best match first.
+
+    Candidates with the same score keep their order. The arguments are the
+    same as `score`.
+
+    >>> from .metadata import Metadata
+    >>> rank(Metadata(title='Yesterday'), [('Tomorrow', '', '', 0),
+    ...                                    ('Yesterday', '', '', 0),
+    ...                                    ('Yesterday (Live)', '', '', 0)])
+    [1, 2, 0]
+    """
+    scores = score(metadata, candidates, use_numpy)
+    return sorted(xrange(len(candidates)), key=lambda i: -scores[i])
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
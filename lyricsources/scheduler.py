@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import collections
+import logging
+import threading
+import time
+
+from . import tracing
+
+__all__ = (
+    'PRIORITY_BACKGROUND',
+    'PRIORITY_INTERACTIVE',
+    'Task',
+    'TaskScheduler',
+    )
+
+# Tasks that a user is waiting for, such as the lyric of the playing track.
+PRIORITY_INTERACTIVE = 0
+# Bulk work such as library scans and prefetching.
+PRIORITY_BACKGROUND = 1
+
+class Task(object):
+    """ A unit of work run by a TaskScheduler.
+
+    Like BaseTaskThread, the `target` does the task and returns the results.
+    If the task fails, an Exception SHOULD be raised in the target.
+    """
+
+    def __init__(self, onfinish, onerror, target, args=(), kwargs={},
+                 priority=PRIORITY_INTERACTIVE, onstart=None):
+        """
+
+        Arguments:
+
+        - `onfinish`: A callable object to be invoked with the value returned
+          by `target`.
+        - `onerror`: A callable object to be invoked with the exception raised
+          by `target`.
+        - `target`: The callable object that does the task.
+        - `args`: The argument tuple for the target invocation. Defaults to `()`.
+        - `kwargs`: A dictionary of keyword arguments for the target invocation.
+          Defaults to `{}`.
+        - `priority`: `PRIORITY_INTERACTIVE` or `PRIORITY_BACKGROUND`.
+        - `onstart`: (optional) A callable object to be invoked without
+          arguments when a worker thread starts the task.
+
+        All callbacks are run in the worker thread, not the main thread.
+        The task belongs to the trace of the thread creating it (see
+        lyricsources.tracing).
+        """
+        self._onfinish = onfinish
+        self._onerror = onerror
+        self._onstart = onstart
+        self._target = target
+        self._args = args
+        self._kwargs = kwargs
+        self.priority = priority
+        self._trace = tracing.current_context()
+        self._created = time.time()
+
+    def run(self):
+        old_trace = tracing.swap_context(self._trace)
+        try:
+            tracing.record('queue wait', self._created)
+            if self._onstart is not None:
+                self._onstart()
+            with tracing.span('task'):
+                try:
+                    ret = self._target(*self._args, **self._kwargs)
+                except Exception as e:
+                    logging.exception('Got exception in task')
+                    self._onerror(e)
+                else:
+                    self._onfinish(ret)
+        finally:
+            tracing.swap_context(old_trace)
+
+
+class TaskScheduler(object):
+    """ Runs tasks in a bounded pool of worker threads.
+
+    Interactive tasks always run before background tasks, and at most
+    `max_background` workers run background tasks at the same time, so the
+    other workers are kept for interactive tasks. Tasks of the same priority
+    run in the order they are submitted. A queued task can be promoted to
+    interactive or cancelled.
+
+    Worker threads are started on demand, up to `max_workers`, and live as
+    long as the process.
+
+    >>> import threading
+    >>> blocker = threading.Event()
+    >>> done = threading.Event()
+    >>> order = []
+    >>> def onfinish(ret):
+    ...     order.append(ret)
+    ...     if len(order) == 3:
+    ...         done.set()
+    >>> def task(name, priority=PRIORITY_INTERACTIVE):
+    ...     return Task(onfinish, None, target=lambda: name, priority=priority)
+    >>> scheduler = TaskScheduler(max_workers=1)
+    >>> scheduler.submit(Task(onfinish, None, target=blocker.wait))
+    >>> scheduler.submit(task('scan1', PRIORITY_BACKGROUND))
+    >>> scan2 = task('scan2', PRIORITY_BACKGROUND)
+    >>> scheduler.submit(scan2)
+    >>> scheduler.submit(task('playing'))
+    >>> scheduler.cancel(scan2)
+    True
+    >>> blocker.set()
+    >>> done.wait(5)
+    True
+    >>> order[1:]
+    ['playing', 'scan1']
+    """
+
+    def __init__(self, max_workers, max_background=None):
+        """
+
+        Arguments:
+        - `max_workers`: The maximum number of worker threads.
+        - `max_background`: (optional) The maximum number of background tasks
+          running at the same time. Defaults to `max_workers`.
+        """
+        self._max_workers = max_workers
+        self._max_background = max_background if max_background is not None \
+            else max_workers
+        self._cond = threading.Condition()
+        self._queues = {PRIORITY_INTERACTIVE: collections.deque(),
+                        PRIORITY_BACKGROUND: collections.deque()}
+        self._workers = []
+        self._idle = 0
+        self._running_background = 0
+
+    def submit(self, task):
+        """ Queue a Task to be run by a worker thread.
+        """
+        with self._cond:
+            self._queues[task.priority].append(task)
+            self._wake()
+
+    def promote(self, task):
+        """ Make a queued background task interactive.
+
+        Return False if the task is not queued as a background task.
+        """
+        with self._cond:
+            try:
+                self._queues[PRIORITY_BACKGROUND].remove(task)
+            except ValueError:
+                return False
+            task.priority = PRIORITY_INTERACTIVE
+            self._queues[PRIORITY_INTERACTIVE].append(task)
+            self._wake()
+            return True
+
+    def cancel(self, task):
+        """ Remove a task that is not started yet.
+
+        Return False if the task is not queued.
+        """
+        with self._cond:
+            try:
+                self._queues[task.priority].remove(task)
+            except ValueError:
+                return False
+            return True
+
+    def _wake(self):
+        if self._idle == 0 and len(self._workers) < self._max_workers:
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            self._workers.append(worker)
+            worker.start()
+        else:
+            self._cond.notify_all()
+
+    def _next_task(self):
+        if self._queues[PRIORITY_INTERACTIVE]:
+            return self._queues[PRIORITY_INTERACTIVE].popleft()
+        if self._queues[PRIORITY_BACKGROUND] and \
+                self._running_background < self._max_background:
+            self._running_background += 1
+            return self._queues[PRIORITY_BACKGROUND].popleft()
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._idle += 1
+                task = self._next_task()
+                while task is None:
+                    self._cond.wait()
+                    task = self._next_task()
+                self._idle -= 1
+                background = task.priority == PRIORITY_BACKGROUND
+            try:
+                task.run()
+            finally:
+                if background:
+                    with self._cond:
+                        self._running_background -= 1
+                        self._cond.notify_all()
+
+    @property
+    def queued_count(self):
+        """ The number of tasks waiting for a worker.
+        """
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.itervalues())
+
+    @property
+    def queued_counts(self):
+        """ A dict of the number of tasks waiting for a worker by priority.
+        """
+        with self._cond:
+            return dict((priority, len(queue))
+                        for priority, queue in self._queues.iteritems())
+
+    @property
+    def worker_count(self):
+        return len(self._workers)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
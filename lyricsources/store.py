@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import hashlib
+import logging
+import os
+import os.path
+import tempfile
+import threading
+import zlib
+
+from .utils import ensure_path, ensure_utf8
+
+__all__ = (
+    'DownloadStore',
+    )
+
+class DownloadStore(object):
+    """ A persistent store of downloaded lyrics.
+
+    Lyrics are compressed and saved as blobs named by the SHA-1 of their
+    content, so identical lyrics are stored only once. Each key refers to a
+    blob with a small reference file::
+
+      <path>/refs/<sha1 of key>      -- the SHA-1 of the blob
+      <path>/blobs/<xx>/<sha1>       -- the compressed lyric
+
+    Lyrics that differ only slightly, such as the same LRC file from two
+    sources, are detected by passing a fingerprint (see
+    lyricsources.lrc.fingerprint) to `put`. The first blob saved with a
+    fingerprint is indexed::
+
+      <path>/fingerprints/<fingerprint>  -- the SHA-1 of the blob
+
+    `put` reports whether a lyric is equivalent to one saved before. An
+    equivalent lyric with different bytes is still saved as its own blob, so a
+    key always returns exactly what was saved with it.
+
+    Files are written to a temporary file and renamed into place, so a crash
+    never leaves a partial file behind. When blobs take more than `max_size`
+    bytes, the least recently used ones are removed together with the
+    references and fingerprints pointing to them.
+
+    The store can be used from several threads and processes at the same time.
+
+    >>> import shutil
+    >>> path = tempfile.mkdtemp()
+    >>> store = DownloadStore(path, max_size=1024 * 1024)
+    >>> store.get('lrc123:1') is None
+    True
+    >>> store.put('lrc123:1', '[00:01.00]Hello')
+    False
+    >>> store.put('xiami:2', u'[00:01.00]Hello')
+    False
+    >>> store.get('lrc123:1')
+    '[00:01.00]Hello'
+    >>> DownloadStore(path).get('xiami:2')
+    '[00:01.00]Hello'
+    >>> len(os.listdir(os.path.join(path, 'refs'))), store.size < 100
+    (2, True)
+    >>> store.put('netease:3', '[00:01.00] hello ', fingerprint='f')
+    False
+    >>> store.put('viewlyrics:4', '[ti:Hi]\\n[00:01.00]Hello', fingerprint='f')
+    True
+    >>> store.get('viewlyrics:4')
+    '[ti:Hi]\\n[00:01.00]Hello'
+    >>> store.get('netease:3')
+    '[00:01.00] hello '
+    >>> store.max_size = 16
+    >>> store.put('qianqian:5', 'Bye')
+    False
+    >>> len(os.listdir(os.path.join(path, 'refs'))), os.listdir(os.path.join(path, 'fingerprints'))
+    (1, [])
+    >>> store.get('qianqian:5')
+    'Bye'
+    >>> shutil.rmtree(path)
+    """
+
+    def __init__(self, path, max_size=32 * 1024 * 1024):
+        """
+
+        Arguments:
+        - `path`: The directory to save the store.
+        - `max_size`: (optional) The maximum size in bytes of all blobs.
+        """
+        self._path = path
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        # Total size of blobs, counted on the first write so that opening
+        # the store stays cheap.
+        self._size = None
+        for subdir in ('refs', 'blobs', 'fingerprints', 'tmp'):
+            ensure_path(os.path.join(path, subdir), ignore_file_name=False)
+
+    def _ref_path(self, key):
+        return os.path.join(self._path, 'refs',
+                            hashlib.sha1(ensure_utf8(key)).hexdigest())
+
+    def _blob_path(self, digest):
+        return os.path.join(self._path, 'blobs', digest[:2], digest)
+
+    def _fingerprint_path(self, fingerprint):
+        return os.path.join(self._path, 'fingerprints', fingerprint)
+
+    def _find_fingerprint(self, fingerprint):
+        """ Return the digest of the blob saved with `fingerprint`, or None.
+        """
+        try:
+            digest = self._read(self._fingerprint_path(fingerprint))
+        except (IOError, OSError):
+            return None
+        if not os.path.exists(self._blob_path(digest)):
+            return None
+        return digest
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _write(self, path, data):
+        fd, tmppath = tempfile.mkstemp(dir=os.path.join(self._path, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            ensure_path(path)
+            os.rename(tmppath, path)
+        except:
+            os.unlink(tmppath)
+            raise
+
+    def get(self, key):
+        """ Return the content stored with `key`, or None if not found.
+        """
+        refpath = self._ref_path(key)
+        try:
+            digest = self._read(refpath)
+            blobpath = self._blob_path(digest)
+            content = zlib.decompress(self._read(blobpath))
+        except (IOError, OSError, zlib.error):
+            if os.path.exists(refpath):
+                self._remove(refpath)
+            return None
+        try:
+            os.utime(blobpath, None)
+        except OSError:
+            pass
+        return content
+
+    def put(self, key, content, fingerprint=None):
+        """ Save `content` with `key`.
+
+        `content` is a string. Unicode strings are saved in UTF-8. If
+        `fingerprint` is given, it is indexed the first time it is seen. Errors
+        are logged rather than raised, since the store is only an optimization.
+
+        Returns True if a lyric with different bytes was saved with the same
+        `fingerprint` before.
+        """
+        content = ensure_utf8(content)
+        digest = hashlib.sha1(content).hexdigest()
+        try:
+            blobpath = self._blob_path(digest)
+            if os.path.exists(blobpath):
+                os.utime(blobpath, None)
+            else:
+                data = zlib.compress(content)
+                self._write(blobpath, data)
+                self._add_size(len(data))
+            # Written after the blob, so that eviction can find them
+            self._write(self._ref_path(key), digest)
+            if fingerprint is not None:
+                equivalent = self._find_fingerprint(fingerprint)
+                if equivalent is None:
+                    self._write(self._fingerprint_path(fingerprint), digest)
+                else:
+                    return equivalent != digest
+        except (IOError, OSError) as e:
+            logging.warning('Cannot save %s to download store: %s', key, e)
+        return False
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _scan_blobs(self):
+        blobs = []
+        blobdir = os.path.join(self._path, 'blobs')
+        for subdir in os.listdir(blobdir):
+            subpath = os.path.join(blobdir, subdir)
+            for name in os.listdir(subpath):
+                path = os.path.join(subpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                blobs.append((st.st_mtime, st.st_size, path))
+        return blobs
+
+    def _add_size(self, size):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(blob[1] for blob in self._scan_blobs())
+            else:
+                self._size += size
+            if self._size > self._max_size:
+                self._evict()
+
+    def _evict(self):
+        """ Remove least recently used blobs until the store takes less than
+        3/4 of `max_size`, and the references and fingerprints pointing to
+        them. Must be called with the lock held.
+        """
+        blobs = self._scan_blobs()
+        blobs.sort()
+        size = sum(blob[1] for blob in blobs)
+        target = self._max_size * 3 / 4
+        removed = set()
+        for mtime, blobsize, path in blobs:
+            if size <= target:
+                break
+            self._remove(path)
+            removed.add(os.path.basename(path))
+            size -= blobsize
+        self._size = size
+        if removed:
+            for subdir in ('refs', 'fingerprints'):
+                self._remove_pointers(os.path.join(self._path, subdir), removed)
+
+    def _remove_pointers(self, dirpath, digests):
+        """ Remove the files in `dirpath` that contain one of `digests`.
+        """
+        for name in os.listdir(dirpath):
+            path = os.path.join(dirpath, name)
+            try:
+                digest = self._read(path)
+            except (IOError, OSError):
+                continue
+            if digest in digests:
+                self._remove(path)
+
+    @property
+    def max_size(self):
+        """ The maximum size in bytes of all blobs.
+        """
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value):
+        self._max_size = value
+
+    @property
+    def size(self):
+        """ The total size of blobs in bytes.
+        """
+        with self._lock:
+            if self._size is None:
+                self._size = sum(blob[1] for blob in self._scan_blobs())
+            return self._size
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import atexit
+import json
+import os
+import threading
+import time
+
+__all__ = (
+    'begin',
+    'context',
+    'current_context',
+    'enabled',
+    'end',
+    'flush',
+    'record',
+    'span',
+    'swap_context',
+    )
+
+# Set it to the path of a file to write traces to. "{pid}" in the path is
+# replaced by the process ID.
+TRACE_ENV = 'LYRICSOURCES_TRACE'
+
+_path = os.environ.get(TRACE_ENV, '')
+enabled = bool(_path)
+
+_local = threading.local()
+_lock = threading.Lock()
+_file = None
+
+
+def _now():
+    return time.time() * 1000000
+
+
+def _close():
+    with _lock:
+        if _file is not None:
+            _file.write('\n]\n')
+            _file.close()
+
+
+def _emit(event):
+    """ Write an event in the Chrome trace event format.
+    """
+    global _file
+    event['pid'] = os.getpid()
+    event['tid'] = threading.current_thread().ident
+    line = json.dumps(event)
+    with _lock:
+        if _file is None:
+            _file = open(_path.replace('{pid}', str(os.getpid())), 'w')
+            _file.write('[\n')
+            atexit.register(_close)
+        else:
+            _file.write(',\n')
+        _file.write(line)
+
+
+def flush():
+    """ Write buffered events to the trace file.
+    """
+    with _lock:
+        if _file is not None:
+            _file.flush()
+
+
+def current_context():
+    """ Return the trace ID that spans in the current thread belong to.
+    """
+    return getattr(_local, 'id', None)
+
+
+def swap_context(id):
+    """ Set the trace ID of the current thread, and return the old one.
+    """
+    old = getattr(_local, 'id', None)
+    _local.id = id
+    return old
+
+
+class context(object):
+    """ Makes spans in a with block belong to the trace `id`.
+
+    Tasks and coroutines started in the block keep the ID when they run in
+    other threads or later in the main loop.
+    """
+
+    def __init__(self, id):
+        self._id = id
+        self._old = None
+
+    def __enter__(self):
+        self._old = swap_context(self._id)
+
+    def __exit__(self, exc_type, exc_value, tb):
+        swap_context(self._old)
+
+
+def begin(name, id, args=None, ts=None):
+    """ Start a span of the trace `id`, such as a search ticket.
+    """
+    if enabled:
+        _emit({'name': name, 'cat': 'lyricsources', 'ph': 'b', 'id': id,
+               'ts': _now() if ts is None else ts, 'args': args or {}})
+
+
+def end(name, id, args=None, ts=None):
+    """ End a span started by `begin`.
+    """
+    if enabled:
+        _emit({'name': name, 'cat': 'lyricsources', 'ph': 'e', 'id': id,
+               'ts': _now() if ts is None else ts, 'args': args or {}})
+
+
+def record(name, start, args=None, id=None):
+    """ Record a span from `start`, a value of time.time(), to now.
+
+    The span belongs to the trace `id`, or to the trace of the current thread
+    if `id` is None.
+    """
+    if not enabled:
+        return
+    if id is None:
+        id = current_context()
+    start = start * 1000000
+    if id is None:
+        _emit({'name': name, 'cat': 'lyricsources', 'ph': 'X', 'ts': start,
+               'dur': _now() - start, 'args': args or {}})
+    else:
+        begin(name, id, args, start)
+        end(name, id)
+
+
+class _Span(object):
+
+    def __init__(self, name, args):
+        self._name = name
+        self._args = args
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.time()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        record(self._name, self._start, self._args)
+
+
+class _NoSpan(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, args=None):
+    """ Return a context manager recording its with block as a span of the
+    current trace.
+
+    Tracing is enabled by setting the environment variable
+    LYRICSOURCES_TRACE to the path of a file. Traces are written in the
+    Chrome trace event format, which can be loaded in chrome://tracing or
+    Perfetto. When tracing is disabled, spans cost almost nothing::
+
+      with tracing.span('parse'):
+          results = parse(content)
+    """
+    if not enabled:
+        return _NO_SPAN
+    return _Span(name, args)
@@ -18,29 +18,45 @@
 # along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import ctypes
 import os
 import os.path
 import stat
 import StringIO
 import sys
+import tempfile
+import time
 import urllib
 import urlparse
 
 import pycurl
 
+from . import tracing
+
 __all__ = (
     'cmd_exists',
+    'curl_timings',
     'ensure_utf8',
     'ensure_unicode',
     'ensure_path',
+    'get_cache_path',
     'get_config_path',
     'http_download',
+    'make_curl',
+    'memory_file',
     'path2uri',
     'url2path',
     )
 
 pycurl.global_init(pycurl.GLOBAL_DEFAULT)
 
+MFD_CLOEXEC = 1
+
+try:
+    _memfd_create = ctypes.CDLL(None, use_errno=True).memfd_create
+except (OSError, AttributeError):
+    _memfd_create = None
+
 # make sure the default encoding is utf-8
 if sys.getdefaultencoding() != 'utf-8':
     reload(sys)
@@ -78,6 +94,25 @@ def get_config_path(filename='', expanduser=True):
         path = os.path.expanduser(path)
     return path
 
+def get_cache_path(filename='', expanduser=True):
+    """
+    Gets the path to save cached files
+
+    Arguments:
+    - `filename`: (optional string) The filename of cached file.
+    - `expanduser`: (optional bool) If the leading "~" should be expanded as user's
+      home directory
+
+    >>> get_cache_path(expanduser=False)
+    '~/.cache/lyricsources/'
+    >>> get_cache_path('downloads', False)
+    '~/.cache/lyricsources/downloads'
+    """
+    path = os.path.join('~/.cache/lyricsources/', filename)
+    if expanduser:
+        path = os.path.expanduser(path)
+    return path
+
 def path2uri(path):
     r"""
     Converts a path to URI with file sheme.
@@ -275,32 +310,15 @@ def get_kde_proxy():
                                          port=port)
     return ProxySettings('no')
 
-def http_download(url, port=0, method='GET', params={}, headers={}, timeout=15, proxy=None):
+def make_curl(url, port=0, method='GET', params={}, headers={}, timeout=15, proxy=None):
     r"""
-    Helper function to download files from website
+    Create a pycurl.Curl object to download `url`, and the buffer to write the
+    content to.
 
-    This function will apply proxy settings and deal redirections automatically.
-    To apply proxy settings, pass an ProxySettings object as the `proxy` parameter.
-
-    If `'User-Agent'` is not set in `headers`, it will be set to `'OSD Lyrics'`.
+    The arguments are the same as `http_download`. This is used by
+    `http_download` and lyricsources.asynchttp.AsyncHTTPClient.
 
-    Arguments:
-     - `url`: The url of the content
-     - `port`: (optional) The port.
-     - `method`: (optional) The HTTP method to download contents. Available values
-                 are `'POST'` or `'GET'`. The default value is `'GET'`.
-     - `params`: (optional) The parameters of the request. It is a dict. If `method`
-                 is `'GET'`, `params` will be encoded and append to the url as the
-                 param part. If `method` is `'POST'`, `params` will be added to
-                 request headers as post data.
-     - `headers`: (optional) A dict of HTTP headers.
-     - `proxy`: (optional) A ProxySettings object to sepcify the proxy to use.
-
-    >>> code, content = http_download('http://www.python.org/')
-    >>> code
-    200
-    >>> content.find('Python') >= 0
-    True
+    Returns: A tuple of the Curl object and a StringIO object.
     """
     c = pycurl.Curl()
     buf = StringIO.StringIO()
@@ -308,6 +326,8 @@ def http_download(url, port=0, method='GET', params={}, headers={}, timeout=15,
     c.setopt(pycurl.DNS_USE_GLOBAL_CACHE, 0)
     c.setopt(pycurl.FOLLOWLOCATION, 1)
     c.setopt(pycurl.MAXREDIRS, 5)
+    if timeout > 0:
+        c.setopt(pycurl.TIMEOUT, timeout)
     c.setopt(pycurl.WRITEFUNCTION, buf.write)
     if method == 'GET' and len(params) > 0:
         params = urllib.urlencode(params)
@@ -342,9 +362,87 @@ def http_download(url, port=0, method='GET', params={}, headers={}, timeout=15,
     else:
         c.setopt(pycurl.PROXY, '')
 
-    c.perform()
+    return c, buf
+
+def http_download(url, port=0, method='GET', params={}, headers={}, timeout=15, proxy=None):
+    r"""
+    Helper function to download files from website
+
+    This function will apply proxy settings and deal redirections automatically.
+    To apply proxy settings, pass an ProxySettings object as the `proxy` parameter.
+
+    If `'User-Agent'` is not set in `headers`, it will be set to `'OSD Lyrics'`.
+
+    Arguments:
+     - `url`: The url of the content
+     - `port`: (optional) The port.
+     - `method`: (optional) The HTTP method to download contents. Available values
+                 are `'POST'` or `'GET'`. The default value is `'GET'`.
+     - `params`: (optional) The parameters of the request. It is a dict. If `method`
+                 is `'GET'`, `params` will be encoded and append to the url as the
+                 param part. If `method` is `'POST'`, `params` will be added to
+                 request headers as post data.
+     - `headers`: (optional) A dict of HTTP headers.
+     - `timeout`: (optional) Seconds before the transfer is aborted. Set it to
+                  0 to wait forever.
+     - `proxy`: (optional) A ProxySettings object to sepcify the proxy to use.
+
+    >>> code, content = http_download('http://www.python.org/')
+    >>> code
+    200
+    >>> content.find('Python') >= 0
+    True
+    """
+    c, buf = make_curl(url, port=port, method=method, params=params,
+                       headers=headers, timeout=timeout, proxy=proxy)
+    start = time.time()
+    try:
+        c.perform()
+    finally:
+        if tracing.enabled:
+            tracing.record('http', start, curl_timings(c))
     return c.getinfo(pycurl.HTTP_CODE), buf.getvalue()
 
+def memory_file(content):
+    r"""
+    Return a file object holding `content` with no name on the file system.
+
+    A memfd is used if the system supports it, otherwise an unlinked temporary
+    file. The file is positioned at the beginning, so that its descriptor can
+    be passed to another process to read the content.
+
+    Arguments:
+    - `content`: A string of bytes.
+
+    >>> f = memory_file('lyric')
+    >>> f.read()
+    'lyric'
+    >>> f.close()
+    """
+    fd = -1
+    if _memfd_create is not None:
+        fd = _memfd_create('lyricsources', MFD_CLOEXEC)
+    if fd >= 0:
+        f = os.fdopen(fd, 'w+b')
+    else:
+        f = tempfile.TemporaryFile()
+    f.write(content)
+    f.flush()
+    f.seek(0)
+    return f
+
+def curl_timings(c):
+    r"""
+    Return a dict of the seconds a finished transfer of the pycurl.Curl object
+    `c` spent on DNS lookup, connection, waiting for the first byte, and in
+    total. It is used as the arguments of HTTP spans in traces.
+    """
+    return {'url': c.getinfo(pycurl.EFFECTIVE_URL),
+            'dns': c.getinfo(pycurl.NAMELOOKUP_TIME),
+            'connect': c.getinfo(pycurl.CONNECT_TIME),
+            'first_byte': c.getinfo(pycurl.STARTTRANSFER_TIME),
+            'total': c.getinfo(pycurl.TOTAL_TIME)}
+
 def ensure_path(path, ignore_file_name=True):
     """ Create directories if necessary.
 
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import gettext
+import logging
+
+import dbus
+import glib
+
+from lyricsources.consts import (LYRIC_SOURCE_PLUGIN_INTERFACE,
+                                 LYRIC_SOURCE_PLUGIN_OBJECT_PATH_PREFIX)
+from lyricsources.coroutine import Future, Return
+from lyricsources.dbusext.service import property as dbus_property
+from lyricsources.lyricsource import (AsyncLyricSourcePlugin, SearchResult,
+                                      DOWNLOAD_SUCCEED, SEARCH_SUCCEED)
+from lyricsources.utils import ensure_unicode
+
+_ = gettext.gettext
+
+gettext.bindtextdomain('lyricsource')
+gettext.textdomain('lyricsource')
+
+LYRIC_SOURCE_PLUGIN_BUS_NAME_PREFIX = 'org.lyricsources.LyricSourcePlugin.'
+
+class RemoteSource(object):
+    """ Calls a lyric source plugin on D-Bus without blocking.
+    """
+
+    def __init__(self, conn, id):
+        self.id = id
+        # Don't introspect, so that the plugin is not activated until it
+        # is used.
+        self._proxy = conn.get_object(LYRIC_SOURCE_PLUGIN_BUS_NAME_PREFIX + id,
+                                      LYRIC_SOURCE_PLUGIN_OBJECT_PATH_PREFIX + id,
+                                      introspect=False,
+                                      follow_name_owner_changes=True)
+        self._iface = dbus.Interface(self._proxy, LYRIC_SOURCE_PLUGIN_INTERFACE)
+        # ticket -> (future, onprogress)
+        self._searches = {}
+        # ticket -> future
+        self._downloads = {}
+        self._iface.connect_to_signal('SearchProgress', self._search_progress)
+        self._iface.connect_to_signal('SearchComplete', self._search_complete)
+        self._iface.connect_to_signal('DownloadComplete', self._download_complete,
+                                      byte_arrays=True)
+
+    def _call(self, method, args, tasks, cancel_method, future, value):
+        """ Call `method`, and map the returned ticket to `value` in `tasks`
+        until `future` is done.
+        """
+        def reply(ticket):
+            if future.done():
+                # Cancelled before the ticket is known
+                cancel_method(ticket, ignore_reply=True)
+                return
+            tasks[ticket] = value
+
+            def ondone(f):
+                tasks.pop(ticket, None)
+                if f.cancelled():
+                    cancel_method(ticket, ignore_reply=True)
+            future.add_done_callback(ondone)
+
+        method(*args, reply_handler=reply, error_handler=future.set_exception)
+
+    def search(self, metadata, onprogress):
+        """ Search with the plugin.
+
+        Returns a Future of the results as a list of dicts. `onprogress` is
+        called with each list of partial results.
+        """
+        future = Future()
+        self._call(self._iface.Search, (metadata,), self._searches,
+                   self._iface.CancelSearch, future, (future, onprogress))
+        return future
+
+    def download(self, downloadinfo):
+        """ Download with the plugin. Returns a Future of the content.
+        """
+        future = Future()
+        self._call(self._iface.Download, (downloadinfo,), self._downloads,
+                   self._iface.CancelDownload, future, future)
+        return future
+
+    def _search_progress(self, ticket, results):
+        if ticket in self._searches:
+            self._searches[ticket][1](results)
+
+    def _search_complete(self, ticket, status, results):
+        if ticket in self._searches:
+            future = self._searches[ticket][0]
+            if status == SEARCH_SUCCEED:
+                future.set_result(results)
+            else:
+                future.set_exception(Exception('Search failed with status %d' % status))
+
+    def _download_complete(self, ticket, status, content):
+        if ticket in self._downloads:
+            future = self._downloads[ticket]
+            if status == DOWNLOAD_SUCCEED:
+                future.set_result(content)
+            else:
+                future.set_exception(Exception(str(content)))
+
+class AggregateSource(AsyncLyricSourcePlugin):
+    """ Lyric source that searches all other sources at once.
+
+    Results are sent as soon as each source answers, with duplicates removed.
+    Sources that do not answer before `Deadline` seconds are ignored. The
+    `downloadinfo` of results is a dict of the `sourceid` and the
+    `downloadinfo` of the source that found it.
+    """
+
+    # The sources keep the downloaded lyrics already
+    download_store_size = 0
+
+    def __init__(self, **kwargs):
+        """
+        """
+        AsyncLyricSourcePlugin.__init__(self, id='aggregate', name=_('All sources'), **kwargs)
+        self._sources = ['netease', 'xiami', 'lrc123', 'viewlyrics']
+        self._deadline = 8.0
+        self._remotes = {}
+
+    @dbus_property(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                   type_signature='as')
+    def Sources(self):
+        """ The IDs of the sources to search.
+        """
+        return self._sources
+
+    @Sources.setter
+    def Sources(self, sources):
+        sources = [str(source) for source in sources if source != self.id]
+        if sources == self._sources:
+            return False
+        self._sources = sources
+
+    @dbus_property(dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                   type_signature='d')
+    def Deadline(self):
+        """ Seconds to wait for the sources to answer a search.
+        """
+        return self._deadline
+
+    @Deadline.setter
+    def Deadline(self, deadline):
+        deadline = float(deadline)
+        if deadline <= 0:
+            raise ValueError('Deadline must be positive')
+        if deadline == self._deadline:
+            return False
+        self._deadline = deadline
+
+    def _remote(self, id):
+        if id not in self._remotes:
+            self._remotes[id] = RemoteSource(self._app.connection, id)
+        return self._remotes[id]
+
+    def _merge(self, sourceid, results, seen):
+        """ Return the results not seen before as SearchResult objects.
+        """
+        merged = []
+        for result in results:
+            key = tuple(u' '.join(ensure_unicode(result.get(k, u'')).split()).lower()
+                        for k in ('title', 'artist', 'album'))
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(SearchResult(sourceid=self.id,
+                                       downloadinfo={'sourceid': sourceid,
+                                                     'downloadinfo': result['downloadinfo']},
+                                       title=result.get('title', ''),
+                                       artist=result.get('artist', ''),
+                                       album=result.get('album', ''),
+                                       comment=result.get('comment', ''),
+                                       length=result.get('length', -1)))
+        return merged
+
+    def do_search(self, metadata):
+        # (sourceid, results, done) in the order they arrive
+        events = []
+        wakeup = [None]
+
+        def notify(event):
+            events.append(event)
+            if wakeup[0] is not None:
+                wakeup[0].set_result(None)
+
+        def ondone(sourceid, future):
+            if future.cancelled():
+                return
+            if future.exc_info() is not None:
+                logging.info('Source %s failed: %s', sourceid, future.exc_info()[1])
+                notify((sourceid, [], True))
+            else:
+                notify((sourceid, future.result(), True))
+
+        def ondeadline():
+            notify((None, [], True))
+            return False
+
+        dbusmetadata = metadata.to_mpris1()
+        futures = []
+        for sourceid in self._sources:
+            future = self._remote(sourceid).search(
+                dbusmetadata,
+                lambda results, sourceid=sourceid: notify((sourceid, results, False)))
+            future.add_done_callback(lambda f, sourceid=sourceid: ondone(sourceid, f))
+            futures.append(future)
+        timer = glib.timeout_add(int(self._deadline * 1000), ondeadline)
+        seen = set()
+        remaining = len(futures)
+        try:
+            while remaining > 0:
+                if not events:
+                    wakeup[0] = Future()
+                    yield wakeup[0]
+                    wakeup[0] = None
+                sourceid, results, done = events.pop(0)
+                if sourceid is None:
+                    logging.info('%d sources did not answer in %s seconds',
+                                 remaining, self._deadline)
+                    timer = None
+                    break
+                if done:
+                    remaining -= 1
+                merged = self._merge(sourceid, results, seen)
+                if merged:
+                    yield merged
+        finally:
+            if timer is not None:
+                glib.source_remove(timer)
+            for future in futures:
+                future.cancel()
+
+    def do_download(self, downloadinfo):
+        if not isinstance(downloadinfo, dict) or \
+                'sourceid' not in downloadinfo or 'downloadinfo' not in downloadinfo:
+            raise TypeError('Expect the downloadinfo as a dict of sourceid and downloadinfo, '
+                            'but got %r' % (downloadinfo,))
+        content = yield self._remote(str(downloadinfo['sourceid'])).download(downloadinfo['downloadinfo'])
+        raise Return(content)
+
+if __name__ == '__main__':
+    aggregate = AggregateSource()
+    aggregate._app.run()
@@ -24,23 +24,25 @@ import re
 
 import pycurl
 
-from lyricsources.lyricsource import BaseLyricSourcePlugin, SearchResult
-from lyricsources.utils import http_download, get_proxy_settings
+from lyricsources import tracing
+from lyricsources.coroutine import Return
+from lyricsources.lyricsource import AsyncLyricSourcePlugin, SearchResult
+from lyricsources.utils import get_proxy_settings
 
 HOST = 'www.lrc123.com'
 SEARCH_URL = '/?keyword=%s&field=all'
 RESULT_PATTERN = re.compile(r'<div class="newscont .*?href="/\?field=singer.*?>(.*?)</a>.*?href="/\?field=album.*?>(.*?)</a>.*?href="/\?field=song.*?>(.*?)</a>.*?href="/download/lrc/(.*?)">LRC', re.DOTALL)
 DOWNLOAD_URL_PREFIX = '/download/lrc/'
 
-class Lrc123Source(BaseLyricSourcePlugin):
+class Lrc123Source(AsyncLyricSourcePlugin):
     """ Lyric source from xiami.com
     """
 
-    def __init__(self):
+    def __init__(self, **kwargs):
         """
         """
 
-        BaseLyricSourcePlugin.__init__(self, id='lrc123', name='LRC123')
+        AsyncLyricSourcePlugin.__init__(self, id='lrc123', name='LRC123', **kwargs)
 
     def do_search(self, metadata):
         keys = []
@@ -52,17 +54,18 @@ class Lrc123Source(BaseLyricSourcePlugin):
         params = {'keyword': urlkey,
                   'field': 'all'}
         try:
-            status, content = http_download(
+            status, content = yield self.http.fetch(
                 url=HOST + '/',
                 params=params,
                 proxy=get_proxy_settings(config=self.config_proxy))
         except pycurl.error as e:
             logging.error('Download failed. %s', e.args[1])
-            return []
+            return
 
         if status < 200 or status >= 400:
             raise httplib.HTTPException(status)
-        match = RESULT_PATTERN.findall(content)
+        with tracing.span('parse'):
+            match = RESULT_PATTERN.findall(content)
         result = []
         if match:
             for artist, album, title, url in match:
@@ -75,18 +78,18 @@ class Lrc123Source(BaseLyricSourcePlugin):
                                            album=album,
                                            sourceid=self.id,
                                            downloadinfo=url))
-        return result
+        yield result
 
     def do_download(self, downloadinfo):
         if not isinstance(downloadinfo, str) and \
                 not isinstance(downloadinfo, unicode):
             raise TypeError('Expect the downloadinfo as a string of url, but got type ',
                             type(downloadinfo))
-        status, content = http_download(url=HOST+downloadinfo,
-                                        proxy=get_proxy_settings(self.config_proxy))
+        status, content = yield self.http.fetch(url=HOST+downloadinfo,
+                                                proxy=get_proxy_settings(self.config_proxy))
         if status < 200 or status >= 400:
             raise httplib.HTTPException(status, '')
-        return content
+        raise Return(content)
 
 if __name__ == '__main__':
     lrc123 = Lrc123Source()
@@ -1,8 +1,10 @@
 import httplib
 import gettext
 import json
-from lyricsources.lyricsource import BaseLyricSourcePlugin, SearchResult
-from lyricsources.utils import ensure_utf8, http_download, get_proxy_settings
+from lyricsources import tracing
+from lyricsources.coroutine import Return
+from lyricsources.lyricsource import AsyncLyricSourcePlugin, SearchResult
+from lyricsources.utils import ensure_utf8, get_proxy_settings
 
 _ = gettext.gettext
 
@@ -13,15 +15,15 @@ NETEASE_LYRIC_URL = '/api/song/lyric'
 gettext.bindtextdomain('lyricsource')
 gettext.textdomain('lyricsource')
 
-class NeteaseSource(BaseLyricSourcePlugin):
+class NeteaseSource(AsyncLyricSourcePlugin):
     """ Lyric source from music.163.com
     """
 
-    def __init__(self):
+    def __init__(self, **kwargs):
         """
         """
 
-        BaseLyricSourcePlugin.__init__(self, id='netease', name=_('Netease'))
+        AsyncLyricSourcePlugin.__init__(self, id='netease', name=_('Netease'), **kwargs)
 
     def do_search(self, metadata):
         keys = []
@@ -33,10 +35,10 @@ class NeteaseSource(BaseLyricSourcePlugin):
         url = NETEASE_HOST + NETEASE_SEARCH_URL
         params = 's=%s&type=1' % urlkey
 
-        status, content = http_download(url=url,
-                                        method='POST',
-                                        params=params,
-                                        proxy=get_proxy_settings(self.config_proxy))
+        status, content = yield self.http.fetch(url=url,
+                                                method='POST',
+                                                params=params,
+                                                proxy=get_proxy_settings(self.config_proxy))
 
         if status < 200 or status >= 400:
             raise httplib.HTTPException(status, '')
@@ -50,13 +52,15 @@ class NeteaseSource(BaseLyricSourcePlugin):
             return SearchResult(title=song['name'],
                                 artist=artist_name,
                                 album=song['album']['name'],
+                                length=song.get('duration', -1),
                                 sourceid=self.id,
                                 downloadinfo=url)
 
-        parsed = json.loads(content)
+        with tracing.span('parse'):
+            parsed = json.loads(content)
         result = list(map(map_func, parsed['result']['songs']))
 
-        return result
+        yield result
 
     def do_download(self, downloadinfo):
         if not isinstance(downloadinfo, str) and \
@@ -64,14 +68,15 @@ class NeteaseSource(BaseLyricSourcePlugin):
             raise TypeError('Expect the downloadinfo as a string of url, but got type ',
                             type(downloadinfo))
 
-        status, content = http_download(url=downloadinfo,
-                                        proxy=get_proxy_settings(self.config_proxy))
+        status, content = yield self.http.fetch(url=downloadinfo,
+                                                proxy=get_proxy_settings(self.config_proxy))
         if status < 200 or status >= 400:
             raise httplib.HTTPException(status)
 
-        parsed = json.loads(content)
+        with tracing.span('parse'):
+            parsed = json.loads(content)
         lyric = parsed['lrc']['lyric']
-        return lyric
+        raise Return(lyric)
 
 if __name__ == '__main__':
     netease = NeteaseSource()
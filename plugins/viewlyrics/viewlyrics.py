@@ -18,13 +18,13 @@
 # along with OSD Lyrics. If not, see <http://www.gnu.org/licenses/>.
 #
 
-import string
-import unicodedata
 import httplib
 import hashlib
 from xml.dom.minidom import parseString
-from lyricsources.lyricsource import BaseLyricSourcePlugin, SearchResult
-from lyricsources.utils import ensure_utf8, http_download, get_proxy_settings
+from lyricsources import tracing
+from lyricsources.coroutine import Return, coroutine
+from lyricsources.lyricsource import AsyncLyricSourcePlugin, SearchResult
+from lyricsources.utils import ensure_utf8, get_proxy_settings
 
 VIEWLYRICS_HOST = 'search.crintsoft.com'
 VIEWLYRICS_SEARCH_URL = '/searchlyrics.htm'
@@ -34,20 +34,10 @@ VIEWLYRICS_QUERY_FORM = '<?xml version=\'1.0\' encoding=\'utf-8\' ?><searchV1 ar
 VIEWLYRICS_AGENT = 'MiniLyrics'
 VIEWLYRICS_KEY = 'Mlv1clt4.0'
 
-def normalize_str(s):
-    """ If s is a unicode string, only keep alphanumeric characters and remove
-        diacritics
-    """
-    try:
-        return ''.join(x for x in unicodedata.normalize('NFKD', s)
-                       if x in string.ascii_letters or x in string.digits).lower()
-    except TypeError:
-        return s
+class ViewlyricsSource(AsyncLyricSourcePlugin):
+    def __init__(self, **kwargs):
 
-class ViewlyricsSource(BaseLyricSourcePlugin):
-    def __init__(self):
-
-        BaseLyricSourcePlugin.__init__(self, id='viewlyrics', name='ViewLyrics')
+        AsyncLyricSourcePlugin.__init__(self, id='viewlyrics', name='ViewLyrics', **kwargs)
 
     def do_search(self, metadata):
         if metadata.title:
@@ -59,30 +49,22 @@ class ViewlyricsSource(BaseLyricSourcePlugin):
         else:
             artist = ''
 
-        result = []
-        page = 0
-        pagesleft = 1
-        while(pagesleft > 0):
-            pageresult, pagesleft = self.real_search(title, artist, page)
-            result += pageresult
-            page += 1
-
         # Remove non-lrc (plain text) results, they cannot be displayed by
         # OSDLyrics for now
         def res_is_lrc(result):
             url = result._downloadinfo
             return url.rfind('lrc') == len(url) - 3
-        result = filter(res_is_lrc, result)
-
-        # Prioritize results whose artist matches
-        if metadata.artist and metadata.title:
-            n_artist = normalize_str(artist)
-            def res_has_same_artist(result):
-                return normalize_str(result._artist) == n_artist
-            result.sort(key=res_has_same_artist, reverse=True)
 
-        return result
+        # Yield results page by page, so that clients get the first page
+        # without waiting for the others
+        page = 0
+        pagesleft = 1
+        while(pagesleft > 0):
+            pageresult, pagesleft = yield self.real_search(title, artist, page)
+            yield filter(res_is_lrc, pageresult)
+            page += 1
 
+    @coroutine
     def real_search(self, title='', artist='', page = 0):
         query = VIEWLYRICS_QUERY_FORM
         query =  query.replace('%title', title)
@@ -96,23 +78,25 @@ class ViewlyricsSource(BaseLyricSourcePlugin):
         masterquery = '\2\0\4\0\0\0' + queryhash.digest() + query
 
         url = VIEWLYRICS_HOST + VIEWLYRICS_SEARCH_URL
-        status, content = http_download(url=url,
-                                        method='POST',
-                                        params=masterquery,
-                                        proxy=get_proxy_settings(self.config_proxy))
+        status, content = yield self.http.fetch(url=url,
+                                                method='POST',
+                                                params=masterquery,
+                                                proxy=get_proxy_settings(self.config_proxy))
 
         if status < 200 or status >= 400:
                 raise httplib.HTTPException(status, '')
 
-        contentbytes = map(ord, content)
-        codekey = contentbytes[1]
-        deccontent = ''
-        for char in contentbytes[22:]:
-                deccontent += chr(char ^ codekey)
+        with tracing.span('parse'):
+            contentbytes = map(ord, content)
+            codekey = contentbytes[1]
+            deccontent = ''
+            for char in contentbytes[22:]:
+                    deccontent += chr(char ^ codekey)
+            dom = parseString(deccontent)
 
         result = []
         pagesleft = 0
-        tagreturn = parseString(deccontent).getElementsByTagName('return')[0]
+        tagreturn = dom.getElementsByTagName('return')[0]
         if tagreturn:
                 pagesleftstr = self.alternative_gettagattribute(tagreturn.attributes.items(), 'PageCount') #tagreturn.attributes['PageCount'].value
                 if pagesleftstr == '':
@@ -132,7 +116,7 @@ class ViewlyricsSource(BaseLyricSourcePlugin):
                                                        album=album,
                                                        sourceid=self.id,
                                                        downloadinfo=url))
-        return result, (pagesleft - page)
+        raise Return((result, pagesleft - page))
 
     def alternative_gettagattribute(self, attrs, key):
         key = key.lower()
@@ -148,11 +132,11 @@ class ViewlyricsSource(BaseLyricSourcePlugin):
                 not isinstance(downloadinfo, unicode):
             raise TypeError('Expect the downloadinfo as a string of url, but got type ',
                             type(downloadinfo))
-        status, content = http_download(url=downloadinfo,
-                                        proxy=get_proxy_settings(self.config_proxy))
+        status, content = yield self.http.fetch(url=downloadinfo,
+                                                proxy=get_proxy_settings(self.config_proxy))
         if status < 200 or status >= 400:
             raise httplib.HTTPException(status, '')
-        return content
+        raise Return(content)
 
 if __name__ == '__main__':
     viewlyrics = ViewlyricsSource()
@@ -23,8 +23,10 @@ import httplib
 # import urlparse
 import gettext
 import HTMLParser
-from lyricsources.lyricsource import BaseLyricSourcePlugin, SearchResult
-from lyricsources.utils import ensure_utf8, http_download, get_proxy_settings
+from lyricsources import tracing
+from lyricsources.coroutine import Return, coroutine
+from lyricsources.lyricsource import AsyncLyricSourcePlugin, SearchResult
+from lyricsources.utils import ensure_utf8, get_proxy_settings
 
 _ = gettext.gettext
 
@@ -36,19 +38,21 @@ XIAMI_SEARCH_PATTERN = re.compile(r'(<a [^<]*?href="http://www.xiami.com/song/(\
 XIAMI_ID_PATTERN = re.compile(r'<a [^<]*?onclick="tag\((\d+).*?>')
 XIAMI_URL_PATTERN = re.compile(r'<lyric>(.*?)</lyric>', re.DOTALL)
 TITLE_ATTR_PATTERN = re.compile(r'title="(.*?)"')
+# The maximum number of results whose urls are resolved at the same time
+XIAMI_MAX_URL_REQUESTS = 4
 
 gettext.bindtextdomain('lyricsource')
 gettext.textdomain('lyricsource')
 
-class XiamiSource(BaseLyricSourcePlugin):
+class XiamiSource(AsyncLyricSourcePlugin):
     """ Lyric source from xiami.com
     """
 
-    def __init__(self):
+    def __init__(self, **kwargs):
         """
         """
 
-        BaseLyricSourcePlugin.__init__(self, id='xiami', name=_('Xiami'))
+        AsyncLyricSourcePlugin.__init__(self, id='xiami', name=_('Xiami'), **kwargs)
         self._search = {}
         self._download = {}
 
@@ -60,52 +64,67 @@ class XiamiSource(BaseLyricSourcePlugin):
             keys.append(metadata.artist)
         urlkey = ensure_utf8('+'.join(keys)).replace(' ', '+')
         url = XIAMI_HOST + XIAMI_SEARCH_URL
-        status, content = http_download(url=url,
-                                        params={'key': urlkey},
-                                        proxy=get_proxy_settings(self.config_proxy))
+        status, content = yield self.http.fetch(url=url,
+                                                params={'key': urlkey},
+                                                proxy=get_proxy_settings(self.config_proxy))
         if status < 200 or status >= 400:
             raise httplib.HTTPException(status, '')
-        match = XIAMI_SEARCH_PATTERN.findall(content)
-        result = []
+        with tracing.span('parse'):
+            match = XIAMI_SEARCH_PATTERN.findall(content)
         if match:
-            for title_elem, id, artist_elem, album_elem in match:
-                title = TITLE_ATTR_PATTERN.search(title_elem).group(1)
-                artist = TITLE_ATTR_PATTERN.search(artist_elem).group(1)
-                album = TITLE_ATTR_PATTERN.search(album_elem).group(1)
-                url = self.get_url(id)
-                if url is not None:
-                    result.append(SearchResult(title=title,
-                                               artist=artist,
-                                               album=album,
-                                               sourceid=self.id,
-                                               downloadinfo=url))
-        return result
+            # Each result needs more requests to get its url. Resolve up to
+            # XIAMI_MAX_URL_REQUESTS of them at the same time, and yield them
+            # in order as soon as they are resolved
+            urls = [self.get_url(id)
+                    for title_elem, id, artist_elem, album_elem in match[:XIAMI_MAX_URL_REQUESTS]]
+            try:
+                for i, (title_elem, id, artist_elem, album_elem) in enumerate(match):
+                    title = TITLE_ATTR_PATTERN.search(title_elem).group(1)
+                    artist = TITLE_ATTR_PATTERN.search(artist_elem).group(1)
+                    album = TITLE_ATTR_PATTERN.search(album_elem).group(1)
+                    url = yield urls[i]
+                    if len(urls) < len(match):
+                        urls.append(self.get_url(match[len(urls)][1]))
+                    if url is not None:
+                        yield [SearchResult(title=title,
+                                            artist=artist,
+                                            album=album,
+                                            sourceid=self.id,
+                                            downloadinfo=url)]
+            finally:
+                # Stop resolving the rest if the search fails or is cancelled
+                for url in urls:
+                    url.cancel()
 
+    @coroutine
     def get_songid(self, id):
-        status, content = http_download(url=XIAMI_HOST + XIAMI_SONG_URL + str(id),
-                                        proxy=get_proxy_settings(self.config_proxy))
+        status, content = yield self.http.fetch(url=XIAMI_HOST + XIAMI_SONG_URL + str(id),
+                                                proxy=get_proxy_settings(self.config_proxy))
         if status < 200 or status >= 400:
-            return None
-        match = XIAMI_ID_PATTERN.search(content)
+            raise Return(None)
+        with tracing.span('parse'):
+            match = XIAMI_ID_PATTERN.search(content)
         if not match:
-            return None
+            raise Return(None)
         songid = match.group(1).strip()
-        return songid
+        raise Return(songid)
 
+    @coroutine
     def get_url(self, id):
-        songid = self.get_songid(id)
-        status, content = http_download(url=XIAMI_HOST + XIAMI_LRC_URL + str(songid),
-                                        proxy=get_proxy_settings(self.config_proxy))
+        songid = yield self.get_songid(id)
+        status, content = yield self.http.fetch(url=XIAMI_HOST + XIAMI_LRC_URL + str(songid),
+                                                proxy=get_proxy_settings(self.config_proxy))
         if status < 200 or status >= 400:
-            return None
-        match = XIAMI_URL_PATTERN.search(content)
+            raise Return(None)
+        with tracing.span('parse'):
+            match = XIAMI_URL_PATTERN.search(content)
         if not match:
-            return None
+            raise Return(None)
         url = match.group(1).strip()
         if url.lower().endswith('.lrc'):
-            return url
+            raise Return(url)
         else:
-            return None
+            raise Return(None)
 
     def do_download(self, downloadinfo):
         if not isinstance(downloadinfo, str) and \
@@ -113,13 +132,13 @@ class XiamiSource(BaseLyricSourcePlugin):
             raise TypeError('Expect the downloadinfo as a string of url, but got type ',
                             type(downloadinfo))
         # parts = urlparse.urlparse(downloadinfo)
-        status, content = http_download(downloadinfo,
-                                        proxy=get_proxy_settings(self.config_proxy))
+        status, content = yield self.http.fetch(downloadinfo,
+                                                proxy=get_proxy_settings(self.config_proxy))
         if status < 200 or status >= 400:
             raise httplib.HTTPException(status)
         if content:
             content = HTMLParser.HTMLParser().unescape(content.decode('utf-8'))
-        return content.encode('utf-8')
+        raise Return(content.encode('utf-8'))
 
 if __name__ == '__main__':
     xiami = XiamiSource()
@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Drive a fake lyric source plugin with Search and Download calls at a
+target rate, and report throughput, latency percentiles and the CPU time and
+memory of the plugin.
+
+The plugin runs on a private D-Bus session bus, so no network, installed
+plugin or running daemon is involved. Its searches and downloads take a
+random time around the given latency and fail at the given rate, in worker
+threads, or in the main loop with --async. Run it from the source tree:
+
+  python2 tools/benchmark-dbus-load.py [-d SECONDS] [-r RATE] [-c CLIENTS]
+      [-l LATENCY] [-f FAILURE_RATE] [--async]
+"""
+
+import os
+import os.path
+import random
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import dbus
+import dbus.bus
+from dbus.mainloop.glib import DBusGMainLoop
+import glib
+
+from lyricsources.app import APP_BUS_PREFIX
+from lyricsources.consts import (LYRIC_SOURCE_PLUGIN_INTERFACE,
+                                 LYRIC_SOURCE_PLUGIN_OBJECT_PATH_PREFIX,
+                                 METRICS_INTERFACE)
+from lyricsources.coroutine import Future, Return
+from lyricsources.lyricsource import (AsyncLyricSourcePlugin,
+                                      BaseLyricSourcePlugin, SearchResult)
+
+PLUGIN_ID = 'loadtest'
+BUS_NAME = APP_BUS_PREFIX + 'LyricSourcePlugin.' + PLUGIN_ID
+OBJECT_PATH = LYRIC_SOURCE_PLUGIN_OBJECT_PATH_PREFIX + PLUGIN_ID
+BUSY_ERROR = 'org.lyricsource.Error.Busy'
+TIMEOUT = 30
+
+
+def sleep(seconds):
+    """ Return a Future that is done after `seconds` in the main loop.
+    """
+    future = Future()
+    glib.timeout_add(int(seconds * 1000), lambda: future.set_result(None) or False)
+    return future
+
+
+class LoadMixin(object):
+    """ Simulated searches and downloads of the fake plugins.
+
+    Caches are disabled, so that every request goes through the D-Bus path
+    and a task, and fake lyrics never reach the download store of the user.
+    """
+
+    search_cache_size = 0
+    download_store_size = 0
+    latency = 0.1
+    failure_rate = 0.0
+    result_count = 10
+    lyric_size = 4096
+
+    def _delay(self):
+        if self.latency <= 0:
+            return 0
+        return random.expovariate(1.0 / self.latency)
+
+    def _results(self, metadata):
+        if random.random() < self.failure_rate:
+            raise Exception('Simulated search failure')
+        return [SearchResult(sourceid=PLUGIN_ID,
+                             title='%s %d' % (metadata.title, i),
+                             artist=metadata.artist,
+                             downloadinfo='%s/%d' % (metadata.title, i))
+                for i in range(self.result_count)]
+
+    def _lyric(self, downloadinfo):
+        if random.random() < self.failure_rate:
+            raise Exception('Simulated download failure')
+        line = '[00:01.00]%s\n' % downloadinfo
+        return (line * (self.lyric_size / len(line) + 1))[:self.lyric_size]
+
+
+class LoadPlugin(LoadMixin, BaseLyricSourcePlugin):
+
+    def __init__(self):
+        BaseLyricSourcePlugin.__init__(self, id=PLUGIN_ID)
+
+    def do_search(self, metadata):
+        time.sleep(self._delay())
+        return self._results(metadata)
+
+    def do_download(self, downloadinfo):
+        time.sleep(self._delay())
+        return self._lyric(downloadinfo)
+
+
+class AsyncLoadPlugin(LoadMixin, AsyncLyricSourcePlugin):
+
+    def __init__(self):
+        AsyncLyricSourcePlugin.__init__(self, id=PLUGIN_ID)
+
+    def do_search(self, metadata):
+        yield sleep(self._delay())
+        yield self._results(metadata)
+
+    def do_download(self, downloadinfo):
+        yield sleep(self._delay())
+        raise Return(self._lyric(downloadinfo))
+
+
+def serve(options):
+    """ Run the fake plugin until it is terminated.
+    """
+    cls = AsyncLoadPlugin if options.async else LoadPlugin
+    cls.latency = options.latency / 1000.0
+    cls.failure_rate = options.failure_rate
+    cls.result_count = options.results
+    cls.lyric_size = options.size
+    if options.workers > 0:
+        cls.max_workers = options.workers
+    if options.no_limits:
+        cls.max_in_flight = 0
+        cls.max_queued = 0
+    # App parses the command line too, and knows none of the options above
+    sys.argv = sys.argv[:1]
+    plugin = cls()
+    plugin.app.run()
+
+
+def start_bus():
+    """ Start a private session bus. Returns the process and its address.
+    """
+    proc = subprocess.Popen(['dbus-daemon', '--session', '--nofork',
+                             '--print-address'],
+                            stdout=subprocess.PIPE)
+    address = proc.stdout.readline().strip()
+    return proc, address
+
+
+def rss_kb(pid):
+    """ Return the resident set size of a process in KiB.
+    """
+    with open('/proc/%d/status' % pid) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def cpu_seconds(pid):
+    """ Return the user and system CPU time a process has used.
+    """
+    with open('/proc/%d/stat' % pid) as f:
+        # The command name in parentheses may contain spaces
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+
+
+def percentile(values, p):
+    """ Return the `p`-th percentile of sorted `values`.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+class LoadGenerator(object):
+    """ Sends requests from many client connections at a target rate, and
+    times them until their completion signal.
+
+    Completion signals are received on one extra connection, so that the
+    cost of matching them does not grow with the number of clients.
+    """
+
+    def __init__(self, address, options):
+        self._options = options
+        self._loop = glib.MainLoop()
+        self._clients = []
+        for i in range(options.clients):
+            conn = dbus.bus.BusConnection(address)
+            proxy = conn.get_object(BUS_NAME, OBJECT_PATH, introspect=False)
+            self._clients.append(dbus.Interface(proxy, LYRIC_SOURCE_PLUGIN_INTERFACE))
+        self._monitor = dbus.bus.BusConnection(address)
+        for signal, kind in (('SearchComplete', 'search'),
+                             ('DownloadComplete', 'download')):
+            self._monitor.add_signal_receiver(self._completion_handler(kind),
+                                              signal_name=signal,
+                                              dbus_interface=LYRIC_SOURCE_PLUGIN_INTERFACE,
+                                              path=OBJECT_PATH,
+                                              byte_arrays=True)
+        # (kind, ticket) -> time the request was sent
+        self._pending = {}
+        # (kind, ticket) -> (time, status) of completions that come before
+        # the reply of the method call
+        self._early = {}
+        self._outstanding = 0
+        self._sent = 0
+        self._start = None
+        self.latencies = []
+        self.failed = 0
+        self.busy = 0
+        self.errors = 0
+
+    def _completion_handler(self, kind):
+        def handler(ticket, status, *args):
+            key = (kind, int(ticket))
+            now = time.time()
+            if key in self._pending:
+                self._complete(self._pending.pop(key), now, status)
+            else:
+                self._early[key] = (now, status)
+        return handler
+
+    def _complete(self, sent, now, status):
+        self._outstanding -= 1
+        if status == 0:
+            self.latencies.append(now - sent)
+        else:
+            self.failed += 1
+
+    def _reply_handler(self, kind, sent):
+        def handler(ticket):
+            key = (kind, int(ticket))
+            if key in self._early:
+                now, status = self._early.pop(key)
+                self._complete(sent, now, status)
+            else:
+                self._pending[key] = sent
+        return handler
+
+    def _error_handler(self, e):
+        self._outstanding -= 1
+        if e.get_dbus_name() == BUSY_ERROR:
+            self.busy += 1
+        else:
+            self.errors += 1
+
+    def _send(self):
+        client = self._clients[self._sent % len(self._clients)]
+        self._sent += 1
+        self._outstanding += 1
+        key = random.randrange(self._options.keys)
+        sent = time.time()
+        if random.random() < self._options.download_ratio:
+            client.Download('track %d/%d' % (key, random.randrange(self._options.results)),
+                            signature='v',
+                            reply_handler=self._reply_handler('download', sent),
+                            error_handler=self._error_handler)
+        else:
+            metadata = dbus.Dictionary({'title': 'track %d' % key,
+                                        'artist': 'artist %d' % (key % 97)},
+                                       signature='sv')
+            client.Search(metadata,
+                          signature='a{sv}',
+                          reply_handler=self._reply_handler('search', sent),
+                          error_handler=self._error_handler)
+
+    def _tick(self):
+        elapsed = time.time() - self._start
+        if elapsed < self._options.duration:
+            due = int(elapsed * self._options.rate)
+            while self._sent < due:
+                self._send()
+            return True
+        if self._outstanding > 0 and elapsed < self._options.duration + TIMEOUT:
+            return True
+        self._loop.quit()
+        return False
+
+    def run(self):
+        """ Send requests for the duration, and wait for the outstanding ones.
+
+        Returns the seconds it takes.
+        """
+        self._start = time.time()
+        glib.timeout_add(5, self._tick)
+        self._loop.run()
+        return time.time() - self._start
+
+    @property
+    def sent(self):
+        return self._sent
+
+    @property
+    def lost(self):
+        return self._outstanding
+
+    def outcomes(self):
+        """ Return the Outcomes metric of the plugin.
+        """
+        proxy = self._monitor.get_object(BUS_NAME, OBJECT_PATH, introspect=False)
+        return proxy.Get(METRICS_INTERFACE, 'Outcomes',
+                         dbus_interface=dbus.PROPERTIES_IFACE)
+
+
+def wait_name(conn, name, proc):
+    deadline = time.time() + TIMEOUT
+    while not conn.name_has_owner(name):
+        if time.time() > deadline:
+            raise RuntimeError('Plugin is not ready in %d seconds' % TIMEOUT)
+        if proc.poll() is not None:
+            raise RuntimeError('Plugin exited with %d' % proc.returncode)
+        time.sleep(0.01)
+
+
+def benchmark(address, options):
+    env = dict(os.environ)
+    env['DBUS_SESSION_BUS_ADDRESS'] = address
+    env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+    plugin = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve'] +
+                              sys.argv[1:], env=env)
+    try:
+        conn = dbus.bus.BusConnection(address)
+        wait_name(conn, BUS_NAME, plugin)
+        conn.close()
+        generator = LoadGenerator(address, options)
+        rss = [rss_kb(plugin.pid)]
+        def sample():
+            rss.append(rss_kb(plugin.pid))
+            return True
+        glib.timeout_add(500, sample)
+        cpu = cpu_seconds(plugin.pid)
+        elapsed = generator.run()
+        cpu = cpu_seconds(plugin.pid) - cpu
+        outcomes = generator.outcomes()
+    finally:
+        plugin.terminate()
+        plugin.wait()
+    latencies = sorted(generator.latencies)
+    print '%s plugin, %.0f ms latency, %.0f%% failures, %d clients' % (
+        'async' if options.async else 'threaded', options.latency,
+        options.failure_rate * 100, options.clients)
+    print 'Sent       %8d requests at %.0f/s' % (generator.sent, options.rate)
+    print 'Succeeded  %8d (%.1f/s)' % (len(latencies), len(latencies) / elapsed)
+    print 'Failed     %8d' % generator.failed
+    print 'Busy       %8d' % generator.busy
+    print 'Errors     %8d' % generator.errors
+    print 'Lost       %8d' % generator.lost
+    print 'Latency    p50 %.1f ms, p95 %.1f ms, p99 %.1f ms, max %.1f ms' % tuple(
+        percentile(latencies, p) * 1000 for p in (50, 95, 99, 100))
+    print 'Plugin CPU %8.2f s (%.0f%%)' % (cpu, cpu * 100 / elapsed)
+    print 'Plugin RSS %8d KiB at start, %d KiB peak' % (rss[0], max(rss))
+    for kind in sorted(outcomes):
+        print 'Outcomes   %-8s %s' % (kind, ', '.join('%s %d' % item
+                                                     for item in sorted(outcomes[kind].items())))
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-d', '--duration', dest='duration', type='float', default=10,
+                      help='Seconds to send requests for')
+    parser.add_option('-r', '--rate', dest='rate', type='float', default=100,
+                      help='Requests per second')
+    parser.add_option('-c', '--clients', dest='clients', type='int', default=16,
+                      help='Number of client connections to send requests from')
+    parser.add_option('-k', '--keys', dest='keys', type='int', default=1000,
+                      help='Number of distinct tracks to search and download')
+    parser.add_option('--download-ratio', dest='download_ratio', type='float',
+                      default=0.5, help='Fraction of requests that are downloads')
+    parser.add_option('-l', '--latency', dest='latency', type='float', default=100,
+                      help='Mean milliseconds a search or download takes')
+    parser.add_option('-f', '--failure-rate', dest='failure_rate', type='float',
+                      default=0.0, help='Fraction of searches and downloads that fail')
+    parser.add_option('--results', dest='results', type='int', default=10,
+                      help='Number of results of each search')
+    parser.add_option('--size', dest='size', type='int', default=4096,
+                      help='Size of each lyric in bytes')
+    parser.add_option('--async', dest='async', action='store_true', default=False,
+                      help='Run searches and downloads as coroutines in the main loop')
+    parser.add_option('--workers', dest='workers', type='int', default=0,
+                      help='Number of worker threads of the plugin')
+    parser.add_option('--no-limits', dest='no_limits', action='store_true', default=False,
+                      help='Disable max_in_flight and max_queued of the plugin')
+    parser.add_option('--serve', dest='serve', action='store_true', default=False,
+                      help='Run the fake plugin, used by the benchmark itself')
+    options, args = parser.parse_args()
+    DBusGMainLoop(set_as_default=True)
+    if options.serve:
+        serve(options)
+        return
+    bus, address = start_bus()
+    try:
+        benchmark(address, options)
+    finally:
+        bus.terminate()
+        bus.wait()
+
+
+if __name__ == '__main__':
+    main()
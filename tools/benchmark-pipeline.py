@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Measure the cost of each stage a search goes through in a lyric source
+plugin, from the D-Bus call to the SearchComplete signal, for 1, 10 and 1000
+results.
+
+The plugin runs in process with a stub connection instead of a bus, so
+signals are marshalled but not sent, and main thread calls are run by the
+benchmark itself. Results can be saved as a baseline, and later runs compared
+with it to find regressions in lyricsources:
+
+  python2 tools/benchmark-pipeline.py --save baseline.json
+  python2 tools/benchmark-pipeline.py --compare baseline.json
+
+A baseline keeps the seconds and the regression threshold of each stage. The
+threshold is the value of -t when the baseline is saved, and can be edited in
+the file for stages that are noisier than others. The comparison exits with
+status 1 if a stage is slower than its threshold allows.
+"""
+
+import json
+import os.path
+import Queue
+import sys
+import threading
+import timeit
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import dbus
+
+from lyricsources.lyricsource import BaseLyricSourcePlugin, SearchResult
+from lyricsources.metadata import Metadata
+from lyricsources.scheduler import Task
+
+SIZES = (1, 10, 1000)
+# The minimum seconds each round of a stage runs for
+MIN_ROUND_TIME = 0.2
+METADATA = dbus.Dictionary({'xesam:title': dbus.String(u'Yesterday'),
+                            'xesam:artist': dbus.Array([dbus.String(u'The Beatles')],
+                                                       signature='s'),
+                            'xesam:album': dbus.String(u'Help!'),
+                            'mpris:length': dbus.Int64(125 * 1000000)},
+                           signature='sv')
+
+
+class StubConnection(object):
+    """ Stands in for a dbus.connection.Connection. Objects can be exported on
+    it, and messages sent to it are dropped.
+    """
+
+    def __init__(self):
+        self.sent = 0
+
+    def _register_object_path(self, path, on_message, on_unregister=None,
+                              fallback=False):
+        pass
+
+    def _unregister_object_path(self, path):
+        pass
+
+    def send_message(self, message):
+        self.sent += 1
+
+
+class StubApp(object):
+    """ Stands in for lyricsources.app.App without a bus or a main loop.
+
+    Calls to `run_on_main_thread` are queued, and run in the calling thread
+    by `run_until`.
+    """
+
+    def __init__(self):
+        self.connection = StubConnection()
+        self.http_client = None
+        self._calls = Queue.Queue()
+
+    def request_bus_name(self, bus_name, do_not_queue=False):
+        pass
+
+    def get_download_store(self, max_size):
+        return None
+
+    def run_on_main_thread(self, target, args=(), kwargs={}):
+        self._calls.put((target, args, kwargs))
+
+    def run_until(self, done):
+        """ Run queued main thread calls until `done()` returns True.
+        """
+        while not done():
+            target, args, kwargs = self._calls.get()
+            target(*args, **kwargs)
+
+
+class PipelinePlugin(BaseLyricSourcePlugin):
+    """ A plugin whose searches return prepared results immediately.
+
+    Caches are disabled, so that every search runs through all stages.
+    """
+
+    search_cache_size = 0
+    download_store_size = 0
+    task_timeout = 0
+
+    def __init__(self, app):
+        BaseLyricSourcePlugin.__init__(self, id='pipeline', app=app)
+        self.results = []
+        self.completed = 0
+
+    def do_search(self, metadata):
+        return list(self.results)
+
+    def _complete_search(self, ticket, status, results):
+        BaseLyricSourcePlugin._complete_search(self, ticket, status, results)
+        self.completed += 1
+
+
+def make_results(count):
+    return [SearchResult(sourceid='pipeline',
+                         title='Yesterday %d' % i,
+                         artist='The Beatles' if i % 2 else 'Artist %d' % i,
+                         album='Help!',
+                         length=125000 + i * 1000,
+                         downloadinfo='http://example.com/%d.lrc' % i)
+            for i in range(count)]
+
+
+def stages(plugin, app):
+    """ Yield the name of each stage and a callable running it once.
+    """
+    yield 'Metadata.from_dict', lambda: Metadata.from_dict(METADATA)
+
+    def thread_start():
+        thread = threading.Thread(target=lambda: None)
+        thread.start()
+        thread.join()
+    yield 'thread start', thread_start
+
+    def task_dispatch():
+        done = []
+        plugin._scheduler.submit(Task(onfinish=lambda ret: app.run_on_main_thread(done.append,
+                                                                                  (ret,)),
+                                      onerror=lambda e: None,
+                                      target=lambda: None))
+        app.run_until(lambda: done)
+    yield 'task dispatch', task_dispatch
+
+    metadata = Metadata.from_dict(METADATA)
+    for size in SIZES:
+        results = make_results(size)
+        dbusresults = [result.to_dict() for result in results]
+        structs = [result.to_struct() for result in results]
+        yield ('rank_results x%d' % size,
+               lambda: plugin.rank_results(metadata, results))
+        yield ('to_dict x%d' % size,
+               lambda: [result.to_dict() for result in results])
+        yield ('to_struct x%d' % size,
+               lambda: [result.to_struct() for result in results])
+        yield ('signal marshalling x%d' % size,
+               lambda: plugin.SearchComplete(0, 0, dbusresults))
+        yield ('struct signal marshalling x%d' % size,
+               lambda: plugin.SearchCompleteStruct(0, 0, structs))
+
+        def search(results=results):
+            plugin.results = results
+            completed = plugin.completed + 1
+            plugin.Search(METADATA)
+            app.run_until(lambda: plugin.completed >= completed)
+        yield 'Search to SearchComplete x%d' % size, search
+
+
+def measure(func, rounds):
+    """ Return the best seconds per call of `func` in `rounds` rounds.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < MIN_ROUND_TIME:
+        number *= 2
+    return min(timer.repeat(rounds, number)) / number
+
+
+def main():
+    parser = OptionParser(usage='%prog [-r ROUNDS] [-t RATIO] [--save PATH | --compare PATH]')
+    parser.add_option('-r', '--rounds', dest='rounds', type='int', default=5,
+                      help='Number of rounds of each stage, the best is reported')
+    parser.add_option('--save', dest='save', metavar='PATH',
+                      help='Save the results as a baseline to PATH')
+    parser.add_option('--compare', dest='compare', metavar='PATH',
+                      help='Compare the results with the baseline in PATH')
+    parser.add_option('-t', '--threshold', dest='threshold', type='float', default=1.25,
+                      help='Ratio to the baseline reported as a regression, for '
+                      'stages without a threshold in the baseline [default: %default]')
+    options, args = parser.parse_args()
+    baseline = {}
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+    app = StubApp()
+    plugin = PipelinePlugin(app)
+    results = {}
+    regressions = []
+    for name, func in stages(plugin, app):
+        seconds = measure(func, options.rounds)
+        results[name] = {'seconds': seconds, 'threshold': options.threshold}
+        line = '%-32s %12.1f us' % (name, seconds * 1000000)
+        if name in baseline:
+            threshold = baseline[name].get('threshold', options.threshold)
+            ratio = seconds / baseline[name]['seconds']
+            line += ' %6.2fx' % ratio
+            if ratio > threshold:
+                line += ' REGRESSION (> %.2fx)' % threshold
+                regressions.append(name)
+        print line
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print 'Saved to %s' % options.save
+    if regressions:
+        print '%d stages are slower than the baseline allows' % len(regressions)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
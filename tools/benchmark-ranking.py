@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Measure lyricsources.ranking with many candidates, with and without NumPy.
+
+  python2 tools/benchmark-ranking.py [-n CANDIDATES] [-r ROUNDS]
+"""
+
+import os.path
+import random
+import sys
+import timeit
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lyricsources import ranking
+from lyricsources.metadata import Metadata
+
+WORDS = ['love', 'night', 'heart', 'rain', 'summer', 'blue', 'dream', 'fire',
+         'river', 'moon', 'home', 'light', 'road', 'star', 'time', 'song',
+         u'月亮', u'心', u'雨天', u'梦']
+
+
+def make_candidates(count, seed=0):
+    rand = random.Random(seed)
+
+    def words(n):
+        return u' '.join(rand.choice(WORDS) for i in xrange(n))
+
+    return [(words(rand.randint(1, 4)), words(rand.randint(1, 2)),
+             words(rand.randint(0, 3)),
+             rand.choice([-1, rand.randint(120, 360) * 1000]))
+            for i in xrange(count)]
+
+
+def main():
+    parser = OptionParser(usage='%prog [-n CANDIDATES] [-r ROUNDS]')
+    parser.add_option('-n', '--candidates', dest='count', type='int', default=10000)
+    parser.add_option('-r', '--rounds', dest='rounds', type='int', default=5,
+                      help='Number of rounds, the best is reported')
+    options, args = parser.parse_args()
+    track = Metadata(title='summer night rain', artist='blue moon',
+                     album='dream', length=240000)
+    candidates = make_candidates(options.count)
+    backends = [('python', False)]
+    if ranking.numpy is not None:
+        backends.append(('numpy', True))
+    else:
+        print 'NumPy is not installed, only the pure Python backend is measured'
+    print '%d candidates, best of %d rounds' % (len(candidates), options.rounds)
+    for name, use_numpy in backends:
+        elapsed = min(timeit.repeat(lambda: ranking.rank(track, candidates, use_numpy),
+                                    repeat=options.rounds, number=1))
+        print '%-8s %8.1f ms' % (name, elapsed * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Compare the two formats search results can be sent in: the dicts of
+SearchComplete (aa{sv}) and the structs of SearchCompleteStruct (a(sssssiv)).
+
+For each number of results, it reports the time to convert the results, to
+marshal them into a signal message and to read them back from it, and the
+size of the message body on the wire. dbus-python does not expose the
+encoded message, so the size is computed from the D-Bus wire format, and the
+computation is checked against messages encoded by hand before measuring:
+
+  python2 tools/benchmark-result-encoding.py [-n COUNTS] [-r ROUNDS]
+"""
+
+import os.path
+import sys
+import timeit
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dbus
+import dbus.lowlevel
+
+from lyricsources.consts import (LYRIC_SOURCE_PLUGIN_INTERFACE,
+                                 LYRIC_SOURCE_PLUGIN_OBJECT_PATH_PREFIX)
+from lyricsources.dbusext.property import split_signature
+from lyricsources.lyricsource import RESULT_STRUCT_SIGNATURE, SearchResult
+
+OBJECT_PATH = LYRIC_SOURCE_PLUGIN_OBJECT_PATH_PREFIX + 'viewlyrics'
+FORMATS = [('dict', 'SearchComplete', 'iiaa{sv}',
+            lambda result: result.to_dict()),
+           ('struct', 'SearchCompleteStruct', 'iia(%s)' % RESULT_STRUCT_SIGNATURE,
+            lambda result: result.to_struct())]
+
+# Alignment and size of D-Bus types on the wire
+ALIGNMENTS = {'y': 1, 'b': 4, 'n': 2, 'q': 2, 'i': 4, 'u': 4, 'x': 8, 't': 8,
+              'd': 8, 'h': 4, 's': 4, 'o': 4, 'g': 1, 'v': 1, 'a': 4, '(': 8,
+              '{': 8}
+FIXED_SIZES = {'y': 1, 'b': 4, 'n': 2, 'q': 2, 'i': 4, 'u': 4, 'x': 8, 't': 8,
+               'd': 8, 'h': 4}
+DBUS_SIGNATURES = [(dbus.ByteArray, 'ay'), (dbus.Byte, 'y'), (dbus.Boolean, 'b'),
+                   (dbus.Int16, 'n'), (dbus.UInt16, 'q'), (dbus.Int32, 'i'),
+                   (dbus.UInt32, 'u'), (dbus.Int64, 'x'), (dbus.UInt64, 't'),
+                   (dbus.Double, 'd'), (dbus.ObjectPath, 'o'),
+                   (dbus.Signature, 'g')]
+# Message bodies encoded by hand following the D-Bus specification, in
+# little-endian hex, to check `body_size`
+KNOWN_ENCODINGS = [
+    ('s', (u'abc',), '03000000 616263 00'),
+    ('ii', (1, 2), '01000000 02000000'),
+    # The dict entry is aligned to 8, and the int in the variant to 4
+    ('ia{sv}', (1, {'a': 1}),
+     '01000000 10000000 01000000 6100 016900 000000 01000000'),
+    # The struct is aligned to 8, and so is the int64 in it
+    ('a(sx)', ([('a', dbus.Int64(1))],),
+     '10000000 00000000 01000000 6100 0000 0100000000000000'),
+    # An empty array is still padded to the alignment of its elements
+    ('ia(s)', (1, dbus.Array([], signature='(s)')), '01000000 00000000'),
+    ('v', (dbus.ByteArray('ab'),), '02 617900 02000000 6162'),
+    ]
+
+
+def guess_signature(value):
+    """ Return the signature dbus-python gives to `value` in a variant.
+    """
+    guess = getattr(dbus.lowlevel.Message, 'guess_signature', None)
+    if guess is not None:
+        return str(guess(value))
+    for dbustype, signature in DBUS_SIGNATURES:
+        if isinstance(value, dbustype):
+            return signature
+    if isinstance(value, bool):
+        return 'b'
+    if isinstance(value, int):
+        return 'i'
+    if isinstance(value, long):
+        return 'x'
+    if isinstance(value, float):
+        return 'd'
+    if isinstance(value, basestring):
+        return 's'
+    if isinstance(value, dict):
+        if getattr(value, 'signature', None):
+            return 'a{%s}' % value.signature
+        if not value:
+            return 'a{sv}'
+        k, v = next(value.iteritems())
+        return 'a{%s%s}' % (guess_signature(k), guess_signature(v))
+    if isinstance(value, tuple):
+        return '(%s)' % ''.join(guess_signature(v) for v in value)
+    if isinstance(value, list):
+        if getattr(value, 'signature', None):
+            return 'a' + value.signature
+        return 'a' + (guess_signature(value[0]) if value else 'v')
+    raise TypeError('Cannot guess the D-Bus type of %r' % (value,))
+
+
+def _align(offset, alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def marshalled_end(signature, value, offset=0):
+    """ Return the offset where `value` of the complete type `signature` ends
+    when it is written at `offset` of a message body.
+    """
+    code = signature[0]
+    offset = _align(offset, ALIGNMENTS[code])
+    if code in FIXED_SIZES:
+        return offset + FIXED_SIZES[code]
+    if code in 'so':
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        return offset + 4 + len(value) + 1
+    if code == 'g':
+        return offset + 1 + len(value) + 1
+    if code == 'v':
+        inner = guess_signature(value)
+        return marshalled_end(inner, value, offset + 1 + len(inner) + 1)
+    if code == 'a':
+        element = signature[1:]
+        offset = _align(offset + 4, ALIGNMENTS[element[0]])
+        if element[0] == '{':
+            key, val = split_signature(element[1:-1])
+            for k, v in value.iteritems():
+                offset = _align(offset, 8)
+                offset = marshalled_end(val, v, marshalled_end(key, k, offset))
+        else:
+            for item in value:
+                offset = marshalled_end(element, item, offset)
+        return offset
+    if code == '(':
+        for field, item in zip(split_signature(signature[1:-1]), value):
+            offset = marshalled_end(field, item, offset)
+        return offset
+    raise ValueError('Unsupported signature %s' % signature)
+
+
+def body_size(signature, args):
+    """ Return the size in bytes of a message body of `args`.
+    """
+    offset = 0
+    for arg_signature, arg in zip(split_signature(signature), args):
+        offset = marshalled_end(arg_signature, arg, offset)
+    return offset
+
+
+def check_body_size():
+    """ Raise AssertionError if `body_size` disagrees with one of
+    `KNOWN_ENCODINGS`.
+    """
+    for signature, args, encoded in KNOWN_ENCODINGS:
+        expected = len(encoded.replace(' ', '').decode('hex'))
+        size = body_size(signature, args)
+        if size != expected:
+            raise AssertionError('Body of %s is %d bytes, but %d is computed' %
+                                 (signature, expected, size))
+
+
+def make_results(count):
+    """ Results like the ones of viewlyrics, which returns a lot of them.
+    """
+    return [SearchResult(sourceid='viewlyrics',
+                         title=u'Song title %d' % i,
+                         artist=u'Artist name',
+                         album=u'Album name' if i % 3 else u'',
+                         length=200000 + i * 1000 if i % 2 else -1,
+                         downloadinfo='http://www.viewlyrics.com/lyrics/a/artist_name-song_%d.lrc' % i)
+            for i in range(count)]
+
+
+def best(func, rounds):
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < 0.2:
+        number *= 2
+    return min(timer.repeat(rounds, number)) / number
+
+
+def main():
+    parser = OptionParser(usage='%prog [-n COUNTS] [-r ROUNDS]')
+    parser.add_option('-n', '--counts', dest='counts', default='1,10,100,1000',
+                      help='Comma separated numbers of results [default: %default]')
+    parser.add_option('-r', '--rounds', dest='rounds', type='int', default=5,
+                      help='Number of rounds, the best is reported')
+    options, args = parser.parse_args()
+    check_body_size()
+    print '%7s %-7s %12s %12s %12s %10s' % ('results', 'format', 'convert us',
+                                            'marshal us', 'read us', 'bytes')
+    for count in [int(count) for count in options.counts.split(',')]:
+        results = make_results(count)
+        for name, member, signature, convert in FORMATS:
+            values = [convert(result) for result in results]
+            args = (0, 0, values)
+
+            def marshal():
+                message = dbus.lowlevel.SignalMessage(OBJECT_PATH,
+                                                      LYRIC_SOURCE_PLUGIN_INTERFACE,
+                                                      member)
+                message.append(signature=signature, *args)
+                return message
+            message = marshal()
+            print '%7d %-7s %12.1f %12.1f %12.1f %10d' % (
+                count, name,
+                best(lambda: [convert(result) for result in results], options.rounds) * 1000000,
+                best(marshal, options.rounds) * 1000000,
+                best(message.get_args_list, options.rounds) * 1000000,
+                body_size(signature, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -55,9 +55,9 @@ Exec=@PYTHON@ @pkglibdir@/lyricsources/${name}/${name}.py
 PYTHON = r"""# -*- coding: utf-8 -*-
 
 class ${capsname}Source(BaseLyricSourcePlugin):
-    def __init__(self):
+    def __init__(self, **kwargs):
         
-        BaseLyricSourcePlugin.__init__(self, id='${name}', name='${name}')
+        BaseLyricSourcePlugin.__init__(self, id='${name}', name='${name}', **kwargs)
 
     def do_search(self, metadata):
         # return list of SearchResult
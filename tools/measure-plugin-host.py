@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011  Tiger Soldier
+#
+# This file is part of OSD Lyrics.
+#
+# OSD Lyrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OSD Lyrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OSD Lyrics.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Compare the startup time and memory of lyric source plugins run as one
+process each and run together in lyricsources.host.
+
+Plugins are started on a private D-Bus session bus, so the installed plugins
+and a running daemon are not affected. Run it from the source tree:
+
+  python2 tools/measure-plugin-host.py [-r ROUNDS] [PLUGIN...]
+"""
+
+import os
+import os.path
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+import dbus.bus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_DIR = os.path.join(ROOT, 'plugins')
+BUS_NAME_PREFIX = 'org.lyricsources.LyricSourcePlugin.'
+TIMEOUT = 30
+
+
+def start_bus():
+    """ Start a private session bus. Returns the process and its address.
+    """
+    proc = subprocess.Popen(['dbus-daemon', '--session', '--nofork',
+                             '--print-address'],
+                            stdout=subprocess.PIPE)
+    address = proc.stdout.readline().strip()
+    return proc, address
+
+
+def rss_kb(pid):
+    """ Return the resident set size of a process in KiB.
+    """
+    with open('/proc/%d/status' % pid) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def wait_names(conn, names, procs):
+    deadline = time.time() + TIMEOUT
+    while not all(conn.name_has_owner(name) for name in names):
+        if time.time() > deadline:
+            raise RuntimeError('Plugins are not ready in %d seconds' % TIMEOUT)
+        for proc in procs:
+            if proc.poll() is not None:
+                raise RuntimeError('Process %d exited with %d' %
+                                   (proc.pid, proc.returncode))
+        time.sleep(0.01)
+
+
+def measure(address, commands, names):
+    """ Run `commands` and wait until all `names` are owned.
+
+    Returns the seconds it takes and the total RSS in KiB of the processes.
+    """
+    env = dict(os.environ)
+    env['DBUS_SESSION_BUS_ADDRESS'] = address
+    env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+    conn = dbus.bus.BusConnection(address)
+    start = time.time()
+    procs = [subprocess.Popen(command, env=env) for command in commands]
+    try:
+        wait_names(conn, names, procs)
+        elapsed = time.time() - start
+        # Let the processes settle before reading their memory
+        time.sleep(0.5)
+        rss = sum(rss_kb(proc.pid) for proc in procs)
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+        conn.close()
+    return elapsed, rss
+
+
+def main():
+    parser = OptionParser(usage='%prog [-r ROUNDS] [PLUGIN...]')
+    parser.add_option('-r', '--rounds', dest='rounds', type='int', default=5,
+                      help='Number of rounds of each mode, the best is reported')
+    options, plugins = parser.parse_args()
+    if not plugins:
+        plugins = sorted(name for name in os.listdir(PLUGIN_DIR)
+                         if os.path.isfile(os.path.join(PLUGIN_DIR, name, name + '.py')))
+    paths = [os.path.join(PLUGIN_DIR, name, name + '.py') for name in plugins]
+    names = [BUS_NAME_PREFIX + name for name in plugins]
+    modes = [('one process per plugin',
+              [[sys.executable, path] for path in paths]),
+             ('single host process',
+              [[sys.executable, '-m', 'lyricsources.host'] + paths])]
+    bus, address = start_bus()
+    try:
+        print 'Plugins: %s, best of %d rounds' % (', '.join(plugins), options.rounds)
+        for title, commands in modes:
+            results = [measure(address, commands, names)
+                       for i in range(options.rounds)]
+            elapsed = min(result[0] for result in results)
+            rss = min(result[1] for result in results)
+            print '%-24s %4d processes %8.1f ms %8d KiB' % (title, len(commands),
+                                                           elapsed * 1000, rss)
+    finally:
+        bus.terminate()
+        bus.wait()
+
+
+if __name__ == '__main__':
+    main()